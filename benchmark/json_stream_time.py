@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# Copyright 2019 Cohesity Inc.
+# Author : Cohesity Developer <cohesity-api-sdks@cohesity.com>
+# This script measures the streamed decoding of a large response (see cohesity_json_stream.py) against
+# json.loads of the whole body. The body is the registration info of the protection sources of the mock
+# cluster, whose rootNodes are skipped to read the statsByEnv of the --lean mode of the unprotected objects
+# check. It exits with 1 if the streamed decoding is slower than the limit, so it can be run as a regression
+# test of the cost of skipping a value, which must grow with the size of the body and not with its square.
+#
+# Usage :
+# python json_stream_time.py --sources 20000 --max_ratio 3
+#
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+
+from cohesity_json_stream import JsonStream
+from cohesity_rest import STREAM_CHUNK_SIZE
+from mock_cluster import ClusterData
+
+
+def chunks(body):
+    """
+    Method to split a body like the chunks of a streamed response
+    :return: generator of the chunks
+    """
+    for start in range(0, len(body), STREAM_CHUNK_SIZE):
+        yield body[start:start + STREAM_CHUNK_SIZE]
+
+
+def best_secs(function, repeat):
+    """
+    Method to time a function
+    :return: seconds(float): of the fastest call
+    """
+    secs = []
+    for _ in range(repeat):
+        start = time.time()
+        function()
+        secs.append(time.time() - start)
+    return min(secs)
+
+
+def parse_args():
+    argp = argparse.ArgumentParser()
+    argp.add_argument('--sources', type=int, default=20000,
+                      help='number of registered protection sources in the body')
+    argp.add_argument('--max_ratio', type=float, default=3,
+                      help='highest allowed time of the streamed decoding, in times the time of json.loads')
+    argp.add_argument('--repeat', type=int, default=3,
+                      help='decodings of the body, the fastest one is reported')
+    return argp.parse_args()
+
+
+def main():
+    args = parse_args()
+    body = json.dumps(ClusterData(alerts=0, sources=args.sources).registration_info).encode('utf-8')
+    stream_secs = best_secs(lambda: list(JsonStream(chunks(body)).records('statsByEnv')), args.repeat)
+    loads_secs = best_secs(lambda: json.loads(body.decode('utf-8')).get('statsByEnv'), args.repeat)
+    sys.stdout.write('body {0:.1f}MB, streamed statsByEnv {1:.3f}s, json.loads {2:.3f}s\n'.format(
+        len(body) / 1024.0 ** 2, stream_secs, loads_secs))
+    if stream_secs > args.max_ratio * loads_secs:
+        sys.stdout.write('REGRESSION streamed decoding takes {0:.1f} times json.loads, limit is {1:.0f}\n'.format(
+            stream_secs / loads_secs, args.max_ratio))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
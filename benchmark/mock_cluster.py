@@ -0,0 +1,436 @@
+#!/usr/bin/env python
+# Copyright 2019 Cohesity Inc.
+# Author : Cohesity Developer <cohesity-api-sdks@cohesity.com>
+# This script runs a local stand-in for the Cohesity REST API with synthetic data, used by
+# run_benchmark.py to measure the cohesity nagios scripts. It serves the endpoints called by the scripts:
+#  POST /public/accessTokens
+#  GET  /nexus/cluster/status
+#  GET  /public/alerts
+#  GET  /public/stats/alerts
+#  GET  /public/protectionJobs
+#  GET  /public/protectionRuns
+#  GET  /public/cluster
+#  GET  /public/protectionSources/registrationInfo
+#  GET  /public/statistics/timeSeriesStats
+# The protection runs are computed from their index for every page, so millions of runs take no memory.
+# Every --long_runs_every-th run lasts until just before the next run of its job, or --long_run_secs, the
+# runs still going on are running, without an end time, and get their status when they complete.
+# A failed run that is running during a protection run check and fails before the next one, long after its
+# start, is served with:
+# python mock_cluster.py --runs 10000 --run_days 1 --jobs 100 --long_runs_every 25 --long_run_secs 670
+# (the run started 648 seconds before the mock, fails 22 seconds after it starts)
+# The --idle_jobs jobs have no run in the last --run_days, their last run started 30 days before.
+# The server needs a TLS certificate, a self-signed one is created with openssl if none is given.
+#
+# Usage :
+# python mock_cluster.py --port 8443 --alerts 10000 --runs 1000000 --nodes 256 --sources 5000
+#
+
+import argparse
+import json
+import os
+import shutil
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+
+API_ROOT = '/irisservices/api/v1'
+ACCESS_TOKEN = 'benchmark-access-token'
+ALERT_CATEGORIES = ('kDisk', 'kNode', 'kCluster', 'kNodeHealth', 'kClusterHealth', 'kBackupRestore',
+                    'kEncryption', 'kArchivalRestore', 'kRemoteReplication', 'kQuota', 'kLicense',
+                    'kHeliosProActiveWellness', 'kHeliosAnalyticsJobs', 'kHeliosSignatureJobs', 'kSecurity')
+ALERT_SEVERITIES = ('kCritical', 'kWarning', 'kInfo')
+ENVIRONMENTS = ('kVMware', 'kPhysical', 'kSQL', 'kView', 'kNetapp', 'kGenericNas', 'kOracle', 'kHyperV')
+SECONDS_TO_MICROSECONDS = 1000000
+
+
+class ClusterData(object):
+    def __init__(self, alerts=1000, runs=10000, jobs=50, run_days=7, failed_runs_every=25,
+                 long_runs_every=10, long_run_secs=None, nodes=4, inactive_nodes=0, sources=100,
+                 idle_jobs=0):
+        """
+        Method to initialize the synthetic cluster
+        :param alerts(int): number of alerts
+        :param runs(int): number of protection runs
+        :param jobs(int): number of protection jobs the runs belong to
+        :param run_days(int): days the protection runs are spread over
+        :param failed_runs_every(int): every n-th protection run fails
+        :param long_runs_every(int): every n-th protection run lasts until the next run of its job
+        :param long_run_secs(int): seconds a long protection run lasts instead, below the interval of the job
+        :param nodes(int): number of nodes
+        :param inactive_nodes(int): number of nodes without running services
+        :param sources(int): number of registered protection sources
+        :param idle_jobs(int): number of protection jobs without runs in the last run_days
+        """
+        self.now_usecs = int(time.time() * SECONDS_TO_MICROSECONDS)
+        self.runs = runs
+        self.jobs = max(jobs, 1)
+        self.idle_jobs = idle_jobs
+        self.run_interval_usecs = max(run_days * 86400 * SECONDS_TO_MICROSECONDS // max(runs, 1), 1)
+        self.failed_runs_every = max(failed_runs_every, 1)
+        self.long_runs_every = max(long_runs_every, 1)
+        # The runs of a job do not overlap, a long run ends before the next run of its job starts.
+        self.long_run_usecs = max(self.jobs * self.run_interval_usecs - SECONDS_TO_MICROSECONDS,
+                                  SECONDS_TO_MICROSECONDS)
+        if long_run_secs:
+            self.long_run_usecs = min(long_run_secs * SECONDS_TO_MICROSECONDS, self.long_run_usecs)
+        self.alerts = [self.alert(i) for i in range(alerts)]
+        self.node_status = {'nodeStatus': [self.node(i, i < inactive_nodes) for i in range(nodes)]}
+        self.registration_info = self.sources(sources)
+        self.cluster = {
+            'id': 1,
+            'name': 'benchmark',
+            'usedMetadataSpacePct': 42.5,
+            'stats': {'usagePerfStats': {'totalPhysicalUsageBytes': 300 * 1024 ** 4,
+                                         'physicalCapacityBytes': 1000 * 1024 ** 4}}}
+
+    def alert(self, i):
+        # Newest alerts first, one every 10 seconds.
+        timestamp_usecs = self.now_usecs - i * 10 * SECONDS_TO_MICROSECONDS
+        return {'id': 'alert:{0}'.format(i),
+                'alertCategory': ALERT_CATEGORIES[i % len(ALERT_CATEGORIES)],
+                'alertState': 'kOpen' if i % 4 else 'kResolved',
+                'severity': ALERT_SEVERITIES[i % len(ALERT_SEVERITIES)],
+                'alertCode': 'CE{0:08d}'.format(i % 1000),
+                'alertDocument': {'alertName': 'Benchmark alert {0}'.format(i),
+                                  'alertDescription': 'Synthetic alert generated by the benchmark'},
+                'firstTimestampUsecs': timestamp_usecs,
+                'latestTimestampUsecs': timestamp_usecs,
+                'occurrences': 1}
+
+    def node(self, i, inactive):
+        process_ids = [] if inactive else [1000 + i, 2000 + i]
+        return {'nodeId': i + 1,
+                'nodeIp': '10.0.{0}.{1}'.format(i // 256, i % 256),
+                'serviceStatus': [{'service': service, 'processIds': process_ids}
+                                  for service in ('kMagneto', 'kIris', 'kStorageProxy', 'kBridge')]}
+
+    def sources(self, sources):
+        stats = {}
+        root_nodes = []
+        for i in range(sources):
+            environment = ENVIRONMENTS[i % len(ENVIRONMENTS)]
+            env_stats = stats.setdefault(environment, {'environment': environment,
+                                                       'protectedCount': 0, 'unprotectedCount': 0,
+                                                       'protectedSizeBytes': 0, 'unprotectedSizeBytes': 0})
+            if i % 5:
+                env_stats['protectedCount'] += 1
+                env_stats['protectedSizeBytes'] += 1024 ** 3
+            else:
+                env_stats['unprotectedCount'] += 1
+                env_stats['unprotectedSizeBytes'] += 1024 ** 3
+            root_nodes.append({'rootNode': {'id': i + 1, 'name': 'source-{0}'.format(i),
+                                            'environment': environment},
+                               'registrationInfo': {'accessInfo': {'endpoint': 'source-{0}'.format(i)},
+                                                    'authenticationStatus': 'kFinished',
+                                                    'refreshTimeUsecs': self.now_usecs}})
+        return {'rootNodes': root_nodes, 'statsByEnv': list(stats.values())}
+
+    def protection_run(self, i, now_usecs):
+        """
+        Method to get a protection run, running until its end time
+        :param i(int): index of the run, the newest first
+        :param now_usecs(int): current time
+        :return: run(dict)
+        """
+        start_time_usecs = self.now_usecs - i * self.run_interval_usecs
+        end_time_usecs = start_time_usecs + (self.long_run_usecs if i % self.long_runs_every == 0
+                                             else SECONDS_TO_MICROSECONDS)
+        job_id = i % self.jobs + 1
+        if end_time_usecs > now_usecs:
+            return {'jobId': job_id,
+                    'jobName': 'job-{0}'.format(job_id),
+                    'backupRun': {'status': 'kRunning',
+                                  'stats': {'startTimeUsecs': start_time_usecs}},
+                    'copyRun': [{'status': 'kAccepted', 'target': {'type': 'kLocal'}},
+                                {'status': 'kAccepted', 'target': {'type': 'kArchival'}}]}
+        failed = i % self.failed_runs_every == 0
+        return {'jobId': job_id,
+                'jobName': 'job-{0}'.format(job_id),
+                'backupRun': {'status': 'kFailure' if failed else 'kSuccess',
+                              'error': 'Synthetic backup failure' if failed else None,
+                              'stats': {'startTimeUsecs': start_time_usecs,
+                                        'endTimeUsecs': end_time_usecs}},
+                'copyRun': [{'status': 'kSuccess', 'target': {'type': 'kLocal'}},
+                            {'status': 'kFailure' if i % (self.failed_runs_every * 3) == 1 else 'kSuccess',
+                             'error': 'Synthetic copy failure',
+                             'target': {'type': 'kArchival'}}]}
+
+    def protection_jobs(self, last_run=False):
+        """
+        Method to get the protection jobs
+        :param last_run(bool): add the last run of each job, the first run of a job is its newest
+        :return: list(lst): of protection jobs
+        """
+        now_usecs = int(time.time() * SECONDS_TO_MICROSECONDS)
+        jobs = []
+        for job_id in range(1, self.jobs + 1):
+            job = {'id': job_id, 'name': 'job-{0}'.format(job_id)}
+            if last_run and job_id <= self.runs:
+                job['lastRun'] = self.protection_run(job_id - 1, now_usecs)
+            jobs.append(job)
+        for job_id in range(self.jobs + 1, self.jobs + self.idle_jobs + 1):
+            job = {'id': job_id, 'name': 'job-{0}'.format(job_id)}
+            if last_run:
+                start_time_usecs = self.now_usecs - 30 * 86400 * SECONDS_TO_MICROSECONDS
+                job['lastRun'] = {'jobId': job_id,
+                                  'jobName': job['name'],
+                                  'backupRun': {'status': 'kSuccess',
+                                                'stats': {'startTimeUsecs': start_time_usecs,
+                                                          'endTimeUsecs': start_time_usecs + SECONDS_TO_MICROSECONDS}},
+                                  'copyRun': [{'status': 'kSuccess', 'target': {'type': 'kLocal'}}]}
+            jobs.append(job)
+        return jobs
+
+    def protection_runs(self, start_time_usecs, end_time_usecs, num_runs, job_id=None):
+        """
+        Method to get a page of protection runs, newest first, like the cluster the runs started after the
+        start time and completed before the end time, the running runs only without an end time
+        :param job_id(int): only the runs of this job, the runs of all the jobs if None
+        :return: list(lst): of protection runs
+        """
+        now_usecs = int(time.time() * SECONDS_TO_MICROSECONDS)
+        first = 0
+        if end_time_usecs is not None and end_time_usecs < self.now_usecs:
+            # The runs started after the end time cannot have completed before it.
+            first = (self.now_usecs - end_time_usecs) // self.run_interval_usecs
+        step = 1
+        if job_id is not None:
+            if not 1 <= job_id <= self.jobs:
+                return []
+            # The runs of a job are every jobs-th run.
+            first = first + (job_id - 1 - first) % self.jobs
+            step = self.jobs
+        runs = []
+        for i in range(first, self.runs, step):
+            if len(runs) >= num_runs:
+                break
+            run = self.protection_run(i, now_usecs)
+            stats = run['backupRun']['stats']
+            if start_time_usecs is not None and stats['startTimeUsecs'] < start_time_usecs:
+                break
+            if end_time_usecs is not None and stats.get('endTimeUsecs', end_time_usecs + 1) > end_time_usecs:
+                continue
+            runs.append(run)
+        return runs
+
+    def time_series(self, metric_name, start_time_msecs, end_time_msecs, interval_secs=3600):
+        """
+        Method to get the storage usage time series, the used storage grows by 1% of the capacity a day and
+        the used metadata storage by 0.1% a day
+        :return: time_series(dict)
+        """
+        if metric_name == 'kUsedMetadataSpacePct':
+            used, growth, value = self.cluster['usedMetadataSpacePct'], 0.1, 'doubleValue'
+        else:
+            used = self.cluster['stats']['usagePerfStats']['totalPhysicalUsageBytes']
+            growth = self.cluster['stats']['usagePerfStats']['physicalCapacityBytes'] * 0.01
+            value = 'int64Value'
+        now_msecs = int(time.time() * 1000)
+        points = []
+        timestamp_msecs = max(start_time_msecs, now_msecs - 90 * 86400 * 1000)
+        while timestamp_msecs <= min(end_time_msecs, now_msecs):
+            age_days = float(now_msecs - timestamp_msecs) / (86400 * 1000)
+            level = used - growth * age_days
+            points.append({'timestampMsecs': timestamp_msecs,
+                           'data': {value: int(level) if value == 'int64Value' else round(level, 3)}})
+            timestamp_msecs += interval_secs * 1000
+        return {'dataPointVec': points}
+
+
+def query_list(query, name):
+    """
+    Method to get a list parameter, sent as name=a&name=b or as name[]=a
+    """
+    return [value for key, values in query.items() if key.split('[')[0] == name for value in values]
+
+
+def query_int(query, name, default=None):
+    values = query.get(name)
+    return int(values[0]) if values else default
+
+
+class MockClusterHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def count(self, path):
+        with self.server.lock:
+            self.server.counts[path] = self.server.counts.get(path, 0) + 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        path = urlparse(self.path).path
+        self.count(path)
+        if path == API_ROOT + '/public/accessTokens':
+            return self.send_json(201, {'accessToken': ACCESS_TOKEN, 'tokenType': 'Bearer', 'privileges': []})
+        self.send_json(404, {'message': 'Unknown endpoint ' + path})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        path = url.path
+        query = parse_qs(url.query)
+        data = self.server.data
+        self.count(path)
+        if self.headers.get('Authorization') != 'Bearer ' + ACCESS_TOKEN:
+            return self.send_json(401, {'errorCode': 'KStatusUnauthorized', 'message': 'The access token is invalid.'})
+        if path == API_ROOT + '/nexus/cluster/status':
+            return self.send_json(200, data.node_status)
+        if path == API_ROOT + '/public/cluster':
+            return self.send_json(200, data.cluster)
+        if path == API_ROOT + '/public/protectionSources/registrationInfo':
+            return self.send_json(200, data.registration_info)
+        if path == API_ROOT + '/public/alerts':
+            alerts = data.alerts
+            for name, field in (('alertIdList', 'id'),
+                                ('alertSeverityList', 'severity'),
+                                ('alertCategoryList', 'alertCategory'),
+                                ('alertStateList', 'alertState')):
+                values = query_list(query, name)
+                if values:
+                    alerts = [alert for alert in alerts if alert[field] in values]
+            start_date_usecs = query_int(query, 'startDateUsecs')
+            if start_date_usecs is not None:
+                alerts = [alert for alert in alerts if alert['latestTimestampUsecs'] >= start_date_usecs]
+            return self.send_json(200, alerts[:query_int(query, 'maxAlerts', len(alerts))])
+        if path == API_ROOT + '/public/stats/alerts':
+            open_alerts = [alert for alert in data.alerts if alert['alertState'] == 'kOpen']
+            return self.send_json(200, dict(
+                ('num{0}Alerts'.format(severity[1:]), len([alert for alert in open_alerts
+                                                            if alert['severity'] == severity]))
+                for severity in ALERT_SEVERITIES))
+        if path == API_ROOT + '/public/protectionJobs':
+            return self.send_json(200, data.protection_jobs(
+                query.get('includeLastRunAndStats', [''])[0].lower() == 'true'))
+        if path == API_ROOT + '/public/protectionRuns':
+            return self.send_json(200, data.protection_runs(query_int(query, 'startTimeUsecs'),
+                                                            query_int(query, 'endTimeUsecs'),
+                                                            query_int(query, 'numRuns', 1000),
+                                                            query_int(query, 'jobId')))
+        if path == API_ROOT + '/public/statistics/timeSeriesStats':
+            return self.send_json(200, data.time_series(query.get('metricName', [''])[0],
+                                                        query_int(query, 'startTimeMsecs', 0),
+                                                        query_int(query, 'endTimeMsecs', int(time.time() * 1000)),
+                                                        query_int(query, 'rollupIntervalSecs', 3600)))
+        self.send_json(404, {'message': 'Unknown endpoint ' + path})
+
+
+class MockClusterServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, data, certfile, keyfile):
+        """
+        Method to initialize
+        :param address(tuple): host and port to listen on, port 0 picks a free port
+        :param data(ClusterData): synthetic cluster served
+        """
+        HTTPServer.__init__(self, address, MockClusterHandler)
+        self.data = data
+        self.counts = {}
+        self.lock = threading.Lock()
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        self.socket = context.wrap_socket(self.socket, server_side=True)
+
+    def request_counts(self):
+        """
+        Method to get the number of requests per endpoint and reset the counters
+        :return: counts(dict)
+        """
+        with self.lock:
+            counts = dict((path[len(API_ROOT):], count) for path, count in self.counts.items())
+            self.counts.clear()
+        return counts
+
+
+def self_signed_certificate(directory):
+    """
+    Method to create a self-signed certificate for localhost with openssl
+    :return: list(lst): of certificate and key file paths
+    """
+    certfile = os.path.join(directory, 'cert.pem')
+    keyfile = os.path.join(directory, 'key.pem')
+    subprocess.check_call(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                           '-subj', '/CN=localhost', '-keyout', keyfile, '-out', certfile],
+                          stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
+    return [certfile, keyfile]
+
+
+def add_data_args(argp):
+    argp.add_argument('--alerts', type=int, default=1000, help='number of alerts')
+    argp.add_argument('--runs', type=int, default=10000, help='number of protection runs')
+    argp.add_argument('--jobs', type=int, default=50, help='number of protection jobs')
+    argp.add_argument('--run_days', type=int, default=7, help='days the protection runs are spread over')
+    argp.add_argument('--failed_runs_every', type=int, default=25, help='every n-th protection run fails')
+    argp.add_argument('--long_runs_every', type=int, default=10,
+                      help='every n-th protection run lasts until the next run of its job')
+    argp.add_argument('--long_run_secs', type=int,
+                      help='seconds a long protection run lasts, below the interval of its job')
+    argp.add_argument('--nodes', type=int, default=4, help='number of nodes')
+    argp.add_argument('--inactive_nodes', type=int, default=0, help='number of nodes without running services')
+    argp.add_argument('--sources', type=int, default=100, help='number of registered protection sources')
+    argp.add_argument('--idle_jobs', type=int, default=0,
+                      help='number of protection jobs without runs in the last --run_days')
+    argp.add_argument('--cert', help='TLS certificate, a self-signed one is created if missing')
+    argp.add_argument('--key', help='TLS key of the certificate')
+
+
+def cluster_data(args):
+    return ClusterData(alerts=args.alerts, runs=args.runs, jobs=args.jobs, run_days=args.run_days,
+                       failed_runs_every=args.failed_runs_every, long_runs_every=args.long_runs_every,
+                       long_run_secs=args.long_run_secs, nodes=args.nodes,
+                       inactive_nodes=args.inactive_nodes, sources=args.sources, idle_jobs=args.idle_jobs)
+
+
+def parse_args():
+    argp = argparse.ArgumentParser()
+    argp.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    argp.add_argument('--port', type=int, default=8443, help='port to listen on')
+    add_data_args(argp)
+    return argp.parse_args()
+
+
+def main():
+    args = parse_args()
+    cert_dir = None
+    if args.cert:
+        certfile, keyfile = args.cert, args.key or args.cert
+    else:
+        cert_dir = tempfile.mkdtemp()
+        certfile, keyfile = self_signed_certificate(cert_dir)
+    try:
+        server = MockClusterServer((args.host, args.port), cluster_data(args), certfile, keyfile)
+        sys.stdout.write('Mock cluster listening on {0}:{1}\n'.format(args.host, server.server_address[1]))
+        sys.stdout.flush()
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if cert_dir:
+            shutil.rmtree(cert_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# Copyright 2019 Cohesity Inc.
+# Author : Cohesity Developer <cohesity-api-sdks@cohesity.com>
+# This script runs a local stand-in for an NRDP server, to try the NRDP submission of cohesity_passive_checks.py
+# without a nagios server. It answers the submitcheck command with JSONDATA like NRDP does and prints every
+# received check result as the line nagios would read from its command file.
+#
+# Usage :
+# python nrdp_stub.py --port 8080 --token abcdef
+# python ../src/cohesity_passive_checks.py --auth_file config.ini --service NODES=check_cohesity_node_status
+#                                          --nrdp_url http://127.0.0.1:8080/nrdp/ --nrdp_token abcdef
+#
+
+import argparse
+import json
+import sys
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from urllib.parse import parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from urlparse import parse_qs
+
+
+class NrdpHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def send_result(self, status, message, output=None):
+        result = {'status': status, 'message': message}
+        if output is not None:
+            result['meta'] = {'output': output}
+        body = json.dumps({'result': result}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        form = parse_qs(self.rfile.read(length).decode('utf-8'))
+        if form.get('token', [''])[0] != self.server.token:
+            return self.send_result(-1, 'BAD TOKEN')
+        if form.get('cmd', [''])[0] != 'submitcheck':
+            return self.send_result(-1, 'NO COMMAND SPECIFIED')
+        try:
+            checkresults = json.loads(form['JSONDATA'][0])['checkresults']
+        except (KeyError, ValueError):
+            return self.send_result(-1, 'BAD JSON')
+        now = int(time.time())
+        for checkresult in checkresults:
+            sys.stdout.write('[{0}] PROCESS_SERVICE_CHECK_RESULT;{1};{2};{3};{4}\n'.format(
+                now, checkresult['hostname'], checkresult['servicename'], checkresult['state'],
+                checkresult['output'].replace('\n', '\\n')))
+        sys.stdout.flush()
+        self.send_result(0, 'OK', '{0} checks processed.'.format(len(checkresults)))
+
+
+def parse_args():
+    argp = argparse.ArgumentParser()
+    argp.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    argp.add_argument('--port', type=int, default=8080, help='port to listen on')
+    argp.add_argument('--token', required=True, help='token the submissions have to send')
+    return argp.parse_args()
+
+
+def main():
+    args = parse_args()
+    server = HTTPServer((args.host, args.port), NrdpHandler)
+    server.token = args.token
+    sys.stdout.write('NRDP stand-in listening on http://{0}:{1}/nrdp/\n'.format(args.host, args.port))
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# Copyright 2019 Cohesity Inc.
+# Author : Cohesity Developer <cohesity-api-sdks@cohesity.com>
+# This script measures the cohesity nagios scripts against the local mock cluster of mock_cluster.py.
+# Every check is run as nagios runs it, in a new python process, and the wall time, peak RSS and
+# number of requests to the cluster are reported per check.
+# The results can be saved and compared with a saved run, the comparison fails if a check got slower,
+# used more memory or sent more requests than the tolerance allows.
+#
+# Usage :
+# python run_benchmark.py --alerts 10000 --runs 1000000 --nodes 256 --repeat 3 --save baseline.json
+# python run_benchmark.py --alerts 10000 --runs 1000000 --nodes 256 --repeat 3 --compare baseline.json
+#
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from mock_cluster import MockClusterServer, add_data_args, cluster_data, self_signed_certificate
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src')
+HOST_NAME = 'BenchmarkCluster'
+# Name, script and arguments of the measured checks.
+CASES = (
+    ('alerts', 'check_cohesity_alerts.py', []),
+    ('cluster_health', 'check_cohesity_cluster_health.py', []),
+    ('metastorage', 'check_cohesity_metastorage.py', []),
+    ('node_status', 'check_cohesity_node_status.py', []),
+    ('objects_unprotected', 'check_cohesity_objects_unprotected.py', []),
+    ('protection_runs', 'check_cohesity_protection_runs.py', []),
+    # No failure threshold, so the whole time window is scanned.
+    ('protection_runs_full', 'check_cohesity_protection_runs.py', ['-w', '0:', '-c', '0:']),
+    ('storage', 'check_cohesity_storage.py', []),
+    ('storage_history', 'check_cohesity_storage.py', ['--history']),
+)
+
+
+def peak_rss_mb(rusage):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    if sys.platform == 'darwin':
+        return rusage.ru_maxrss / 1024.0 / 1024.0
+    return rusage.ru_maxrss / 1024.0
+
+
+def run_case(server, cluster_vip, auth_file, state_dir, script, args, timeout):
+    """
+    Method to run one check in a new process
+    :return: result(dict): exit code, first output line, wall time, peak RSS and requests
+    """
+    env = dict(os.environ)
+    # The checks keep their state in the home directory.
+    env['HOME'] = state_dir
+    # The mock cluster certificate is self-signed, CA bundles from the environment would reject it.
+    env.pop('REQUESTS_CA_BUNDLE', None)
+    env.pop('CURL_CA_BUNDLE', None)
+    command = [sys.executable, '-W', 'ignore', os.path.join(SRC_DIR, script),
+               '--cluster_vip', cluster_vip, '--host_name', HOST_NAME, '--auth_file', auth_file,
+               '--timeout', str(timeout)] + list(args)
+    server.request_counts()
+    start = time.time()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
+    output = process.stdout.read().decode('utf-8', 'replace')
+    status, rusage = os.wait4(process.pid, 0)[1:]
+    wall = time.time() - start
+    process.returncode = os.WEXITSTATUS(status)
+    lines = [line for line in output.splitlines() if line.strip()]
+    return {'exitcode': process.returncode,
+            'output': lines[-1] if lines else '',
+            'wall_secs': wall,
+            'peak_rss_mb': peak_rss_mb(rusage),
+            'requests': server.request_counts()}
+
+
+def run_benchmark(server, cluster_vip, auth_file, cases, repeat, warm, timeout):
+    """
+    Method to run every check repeat times
+    :return: results(dict): per check, the median wall time, the highest peak RSS and the requests of the last run
+    """
+    results = {}
+    state_dir = tempfile.mkdtemp()
+    try:
+        for name, script, args in cases:
+            runs = []
+            for _ in range(repeat):
+                if not warm:
+                    # Cold runs start without cached tokens, snapshots and indexes.
+                    shutil.rmtree(state_dir)
+                    os.mkdir(state_dir)
+                runs.append(run_case(server, cluster_vip, auth_file, state_dir, script, args, timeout))
+            walls = sorted(run['wall_secs'] for run in runs)
+            results[name] = {'exitcode': runs[-1]['exitcode'],
+                             'output': runs[-1]['output'],
+                             'wall_secs': walls[len(walls) // 2],
+                             'peak_rss_mb': max(run['peak_rss_mb'] for run in runs),
+                             'requests': runs[-1]['requests']}
+    finally:
+        shutil.rmtree(state_dir)
+    return results
+
+
+def report(results):
+    lines = ['{0:<22} {1:>4} {2:>9} {3:>9} {4:>8}  {5}'.format(
+        'check', 'exit', 'wall(s)', 'rss(MB)', 'requests', 'output')]
+    for name in sorted(results):
+        result = results[name]
+        lines.append('{0:<22} {1:>4} {2:>9.3f} {3:>9.1f} {4:>8}  {5}'.format(
+            name, result['exitcode'], result['wall_secs'], result['peak_rss_mb'],
+            sum(result['requests'].values()), result['output'][:80]))
+    return '\n'.join(lines) + '\n'
+
+
+def regressions(results, baseline, tolerance):
+    """
+    Method to compare the results with a saved run
+    :param tolerance(float): allowed increase of wall time and peak RSS in percent
+    :return: list(lst): of regression messages
+    """
+    messages = []
+    factor = 1 + tolerance / 100.0
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        result, base = results[name], baseline[name]
+        if result['wall_secs'] > base['wall_secs'] * factor:
+            messages.append('{0}: wall time {1:.3f}s, was {2:.3f}s'.format(
+                name, result['wall_secs'], base['wall_secs']))
+        if result['peak_rss_mb'] > base['peak_rss_mb'] * factor:
+            messages.append('{0}: peak RSS {1:.1f}MB, was {2:.1f}MB'.format(
+                name, result['peak_rss_mb'], base['peak_rss_mb']))
+        if sum(result['requests'].values()) > sum(base['requests'].values()):
+            messages.append('{0}: {1} requests, was {2}'.format(
+                name, sum(result['requests'].values()), sum(base['requests'].values())))
+        if result['exitcode'] != base['exitcode']:
+            messages.append('{0}: exit code {1}, was {2}'.format(name, result['exitcode'], base['exitcode']))
+    return messages
+
+
+def parse_args():
+    argp = argparse.ArgumentParser()
+    add_data_args(argp)
+    argp.add_argument('--checks', nargs='+', choices=[case[0] for case in CASES],
+                      help='checks to measure, defaults to all')
+    argp.add_argument('--repeat', type=int, default=1, help='runs of every check')
+    argp.add_argument('--warm', action='store_true',
+                      help='keep the cached tokens and the check state between runs')
+    argp.add_argument('-t', '--timeout', type=int, default=600, help='timeout of every check run')
+    argp.add_argument('--save', help='save the results to this json file')
+    argp.add_argument('--compare', help='json file of a saved run to compare the results with')
+    argp.add_argument('--tolerance', type=float, default=20,
+                      help='allowed increase in percent of wall time and peak RSS over the saved run')
+    return argp.parse_args()
+
+
+def main():
+    args = parse_args()
+    work_dir = tempfile.mkdtemp()
+    try:
+        if args.cert:
+            certfile, keyfile = args.cert, args.key or args.cert
+        else:
+            certfile, keyfile = self_signed_certificate(work_dir)
+        sys.stdout.write('Generating the cluster data\n')
+        sys.stdout.flush()
+        server = MockClusterServer(('127.0.0.1', 0), cluster_data(args), certfile, keyfile)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        cluster_vip = '127.0.0.1:{0}'.format(server.server_address[1])
+        auth_file = os.path.join(work_dir, 'config.ini')
+        with open(auth_file, 'w') as config:
+            config.write('[{0}]\nusername = admin\npassword = admin\ndomain = LOCAL\n'.format(HOST_NAME))
+
+        cases = [case for case in CASES if not args.checks or case[0] in args.checks]
+        results = run_benchmark(server, cluster_vip, auth_file, cases, args.repeat, args.warm, args.timeout)
+        server.shutdown()
+    finally:
+        shutil.rmtree(work_dir)
+
+    sys.stdout.write(report(results))
+    if args.save:
+        with open(args.save, 'w') as saved:
+            json.dump(results, saved, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as saved:
+            messages = regressions(results, json.load(saved), args.tolerance)
+        for message in messages:
+            sys.stdout.write('REGRESSION ' + message + '\n')
+        if messages:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
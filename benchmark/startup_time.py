@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# Copyright 2019 Cohesity Inc.
+# Author : Cohesity Developer <cohesity-api-sdks@cohesity.com>
+# This script measures the start up cost of the check scripts, the time python needs to import them
+# (as reported by python -X importtime), and checks that the heavy modules are not imported at start up.
+# It exits with 1 if a check imports slower than the limit or loads one of the heavy modules, so it can be
+# run as a regression test.
+#
+# Usage :
+# python startup_time.py --max_ms 150 --repeat 5
+#
+
+import argparse
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src')
+CHECKS = ('check_cohesity_alerts',
+          'check_cohesity_cluster_health',
+          'check_cohesity_metastorage',
+          'check_cohesity_node_status',
+          'check_cohesity_objects_unprotected',
+          'check_cohesity_protection_runs',
+          'check_cohesity_storage')
+# Modules only loaded when the cluster is called.
+HEAVY_MODULES = ('requests',
+                 'cohesity_management_sdk.cohesity_client',
+                 'cohesity_management_sdk.api_helper',
+                 'cohesity_management_sdk.controllers.base_controller')
+
+
+def import_time_ms(module):
+    """
+    Method to measure the import of a module in a new python process
+    :return: import time(float): in milliseconds, including the modules it imports
+    """
+    output = subprocess.check_output([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                                     cwd=SRC_DIR, stderr=subprocess.STDOUT).decode('utf-8')
+    for line in output.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) / 1000.0
+    raise ValueError('no import time of {0} in the python output'.format(module))
+
+
+def heavy_modules(module):
+    """
+    Method to get the heavy modules loaded by the import of a module
+    :return: list(lst): of module names
+    """
+    code = 'import sys, {0}; print(" ".join(m for m in {1!r} if m in sys.modules))'.format(module, HEAVY_MODULES)
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=SRC_DIR).decode('utf-8')
+    return output.split()
+
+
+def parse_args():
+    argp = argparse.ArgumentParser()
+    argp.add_argument('--max_ms', type=float, default=150,
+                      help='highest allowed import time of a check in milliseconds')
+    argp.add_argument('--repeat', type=int, default=5,
+                      help='imports of every check, the fastest one is reported')
+    return argp.parse_args()
+
+
+def main():
+    args = parse_args()
+    failures = []
+    sys.stdout.write('{0:<36} {1:>10}  {2}\n'.format('check', 'import(ms)', 'heavy modules'))
+    for check in CHECKS:
+        milliseconds = min(import_time_ms(check) for _ in range(args.repeat))
+        modules = heavy_modules(check)
+        sys.stdout.write('{0:<36} {1:>10.1f}  {2}\n'.format(check, milliseconds, ' '.join(modules) or '-'))
+        if milliseconds > args.max_ms:
+            failures.append('{0}: import takes {1:.1f}ms, limit is {2:.0f}ms'.format(check, milliseconds, args.max_ms))
+        if modules:
+            failures.append('{0}: imports {1} at start up'.format(check, ', '.join(modules)))
+    for failure in failures:
+        sys.stdout.write('REGRESSION ' + failure + '\n')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
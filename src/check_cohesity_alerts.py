@@ -14,6 +14,10 @@
 #
 # If you want alerts of specific category, pass one of the categories listed below in the command line arguments.
 # If alert category is not passed, all category alerts are used to get the nagios status
+# Several categories can be passed, or All for every category. The alerts are fetched once and counted
+# separately for each category, with its own ranges:
+# python check_cohesity_alerts.py --cluster_vip 10.10.99.100 --host_name PaulCluster --auth_file /abc/def/config.ini
+#                                 --alert Disk Node Security --alert_ranges 'Disk=~:2,~:5'
 #
 # Here are the different types of categories
 # Disk - Alerts that are related to Disk.
@@ -35,12 +39,12 @@
 
 
 import argparse
-import configparser
 import datetime
 import logging
 import nagiosplugin
+import os
+import time
 
-from cohesity_management_sdk.cohesity_client import CohesityClient
 from cohesity_management_sdk.exceptions.api_exception import APIException
 from cohesity_management_sdk.models.alert_state_list_enum import (
     AlertStateListEnum)
@@ -49,25 +53,24 @@ from cohesity_management_sdk.models.alert_severity_list_enum import (
 from cohesity_management_sdk.models.alert_category_list_enum import (
     AlertCategoryListEnum)
 
+from cohesity_check_runtime import CohesityCheck, argument_parser, new_check, parse_check_args, run
+from cohesity_token_cache import STATE_DIR, state_file
 
 _log = logging.getLogger('nagiosplugin')
 
+# Alert categories of the --alert argument, All counts each of them separately
+ALERT_CATEGORIES = ['Disk', 'Node', 'Cluster', 'NodeHealth', 'ClusterHealth', 'BackupRestore', 'Encryption',
+                    'ArchivalRestore', 'RemoteReplication', 'Quota', 'License', 'HeliosProActiveWellness',
+                    'HeliosAnalyticsJobs', 'HeliosSignatureJobs', 'Security']
+
 
-class CohesityAlerts(nagiosplugin.Resource):
+class CohesityAlerts(CohesityCheck):
     def __init__(self, args):
         """
         Method to initialize
         :param args: commandline arguments
         """
-        parser = configparser.ConfigParser()
-        parser.read(args.auth_file)
-        self.cohesity_client = CohesityClient(cluster_vip=args.cluster_vip,
-                                              username=parser.get(
-                                                  args.host_name, 'username'),
-                                              password=parser.get(
-                                                  args.host_name, 'password'),
-                                              domain=parser.get(args.host_name, 'domain'))
-        self.args = args
+        super(CohesityAlerts, self).__init__(args)
         self.alert_category = {
             'Disk': AlertCategoryListEnum.KDISK,
             'Node': AlertCategoryListEnum.KNODE,
@@ -86,84 +89,235 @@ class CohesityAlerts(nagiosplugin.Resource):
             'Security': AlertCategoryListEnum.KSECURITY
         }
         self.MAX_ALERTS = 1000
+        # Number of alerts read by id in one request, their ids are in the url
+        self.ALERT_IDS_PAGE_SIZE = 100
+        self.ALERT_SEVERITIES = [AlertSeverityListEnum.KCRITICAL, AlertSeverityListEnum.KWARNING]
+        # Number of critical and of warning alerts shown in the long output
+        self.ALERT_SAMPLES = 5
         self.MICROSECONDS = 10 ** 6
+        # Seconds the nagios server clock may be ahead of the cluster clock
+        self.ALERT_CLOCK_SKEW = 600
 
     @property
     def name(self):
         return 'COHESITY_ALERT_STATUS'
 
+    def query_alerts(self, stream=False, **kwargs):
+        """
+        Method to query the alerts of the monitored alert categories
+        :param stream(bool): get the alerts one at a time while the response is received
+        :param kwargs: filters passed to the get alerts api
+        :return: list of alerts, generator of alerts with stream
+        """
+        if self.args.alert and 'All' not in self.args.alert:
+            kwargs['alert_category_list'] = [self.alert_category[category] for category in self.args.alert]
+        return self.login.call(self.cohesity_client.iter_alerts if stream else self.cohesity_client.get_alerts,
+                               max_alerts=self.MAX_ALERTS, **kwargs)
+
+    def alert_groups(self):
+        """
+        Method to get the groups the alerts are counted in
+        :return: list(lst): of alert category names, [''] when the alerts of all categories are counted together
+        """
+        if 'All' in self.args.alert:
+            return sorted(self.alert_category)
+        return self.args.alert or ['']
+
+    def alert_group(self, alert_category):
+        """
+        Method to get the group an alert is counted in
+        :param alert_category(str): alert category of the alert, like kDisk
+        :return: group(str): alert category name, '' when the alerts of all categories are counted together
+        """
+        return alert_category[1:] if self.args.alert else ''
+
+    def count_alert(self, counts, group, severity, detail):
+        """
+        Method to count a critical or warning alert, the details of the first ALERT_SAMPLES alerts are kept
+        :param counts(dict): critical count, warning count, critical and warning alert details of each group
+        :param detail: alert detail, or a function that formats it
+        """
+        if group not in counts:
+            return
+        if severity == AlertSeverityListEnum.KCRITICAL:
+            position = 0
+        elif severity == AlertSeverityListEnum.KWARNING:
+            position = 1
+        else:
+            return
+        group_counts = counts[group]
+        group_counts[position] = group_counts[position] + 1
+        if len(group_counts[position + 2]) < self.ALERT_SAMPLES:
+            group_counts[position + 2].append(detail() if callable(detail) else detail)
+
     def get_alerts(self):
         """
-        Method to get  critical and warning alerts
-        :return: list of critical and warning alerts
+        Method to get the number of critical and warning alerts, with the details of the newest ones
+        :return: counts(dict): critical count, warning count, critical and warning alert details of each group
         """
+        if self.args.count_only and not self.args.alert:
+            return self.get_alert_counts()
+        if self.args.incremental:
+            return self.get_alerts_incremental()
         try:
-            if self.args.alert == '':
-                alerts_list = self.cohesity_client.alerts.get_alerts(
-                    max_alerts=self.MAX_ALERTS, alert_state_list=AlertStateListEnum.KOPEN)
-            else:
-                alerts_list = self.cohesity_client.\
-                    alerts.get_alerts(alert_category_list=self.alert_category[self.args.alert],
-                                      max_alerts=self.MAX_ALERTS, alert_state_list=AlertStateListEnum.KOPEN)
+            # Info alerts are not counted, the cluster filters them out.
+            alerts_list = self.query_alerts(stream=True,
+                                            alert_state_list=AlertStateListEnum.KOPEN,
+                                            alert_severity_list=self.ALERT_SEVERITIES)
         except APIException as e:
-            _log.debug("get alerts APIException raised: " + e)
-
-        alerts_critical = []
-        alerts_warnings = []
-        for r in alerts_list:
-            alert_detail = "AlertCategory:" + str(r.alert_category[1:]) + \
-                           ", AlertState:" + str(r.alert_state[1:]) + \
-                ", Severity:" + str(r.severity[1:]) + \
-                           ", OccurrenceTime: " + \
-                str(self.epoch_to_date(r.latest_timestamp_usecs))
-            if r.severity == AlertSeverityListEnum.KCRITICAL:
-                alerts_critical.append(alert_detail)
-            if r.severity == AlertSeverityListEnum.KWARNING:
-                alerts_warnings.append(alert_detail)
-        return [alerts_critical, alerts_warnings]
+            _log.debug("get alerts APIException raised: " + str(e))
+            raise
+
+        # The alerts are counted while they are received, only the sampled ones are kept.
+        counts = dict((group, [0, 0, [], []]) for group in self.alert_groups())
+        with self.timer.span('count_alerts') as span:
+            num_alerts = 0
+            for r in alerts_list:
+                num_alerts = num_alerts + 1
+                self.count_alert(counts, self.alert_group(r.alert_category), r.severity,
+                                 lambda: self.alert_detail(r))
+            span['alerts'] = num_alerts
+        return counts
+
+    def get_alert_counts(self):
+        """
+        Method to get the number of active critical and warning alerts from the alert statistics of the cluster
+        :return: counts(dict): critical count, warning count and empty alert details of all the alerts
+        """
+        try:
+            stats = self.login.call(self.cohesity_client.get_active_alerts_stats,
+                                    start_time_usecs=0,
+                                    end_time_usecs=int(time.time() * self.MICROSECONDS))
+        except APIException as e:
+            _log.debug("get alert stats APIException raised: " + str(e))
+            raise
+        return {'': [stats.num_critical_alerts or 0, stats.num_warning_alerts or 0, [], []]}
+
+    def get_alerts_incremental(self):
+        """
+        Method to get critical and warning alerts from a local index of the open alerts.
+        Only the alerts changed since the last seen alert timestamp are fetched and merged in the index,
+        the other alerts of the index are read again by id so that resolved alerts are dropped, and the index
+        is rebuilt from all the open alerts every alert_resync seconds.
+        :return: counts(dict): critical count, warning count, critical and warning alert details of each group
+        """
+        path = os.path.join(STATE_DIR, 'alerts_{0}_{1}.json'.format(
+            self.args.cluster_vip.replace(os.sep, '_'), '+'.join(self.args.alert) or 'all'))
+        now = time.time()
+        with state_file(path) as index:
+            open_alerts = index.get('open_alerts', {})
+            alerts_list = None
+            resynced = False
+            if 'high_water_usecs' in index and now - index['synced_at'] < self.args.alert_resync:
+                alerts_list = self.query_alerts(start_date_usecs=index['high_water_usecs'],
+                                                alert_severity_list=self.ALERT_SEVERITIES)
+                if len(alerts_list) >= self.MAX_ALERTS:
+                    # Too many changes to be sure none were missed.
+                    alerts_list = None
+            if alerts_list is None:
+                alerts_list = self.query_alerts(alert_state_list=AlertStateListEnum.KOPEN,
+                                                alert_severity_list=self.ALERT_SEVERITIES)
+                open_alerts = {}
+                resynced = True
+                index['synced_at'] = now
+                index['high_water_usecs'] = int((now - self.ALERT_CLOCK_SKEW) * self.MICROSECONDS)
+            high_water_usecs = index['high_water_usecs']
+            with self.timer.span('merge_alerts', alerts=len(alerts_list)):
+                for r in alerts_list:
+                    if r.alert_state == AlertStateListEnum.KOPEN and r.severity in self.ALERT_SEVERITIES:
+                        open_alerts[r.id] = {'severity': r.severity,
+                                             'category': r.alert_category,
+                                             'latest_timestamp_usecs': r.latest_timestamp_usecs,
+                                             'detail': self.alert_detail(r)}
+                    else:
+                        open_alerts.pop(r.id, None)
+                    high_water_usecs = max(high_water_usecs, r.latest_timestamp_usecs)
+            if not resynced:
+                # An alert resolved without a new occurrence keeps its timestamp, the changed alerts miss it.
+                changed_ids = set(r.id for r in alerts_list)
+                indexed_ids = [alert_id for alert_id in open_alerts if alert_id not in changed_ids]
+                still_open = self.open_alert_ids(indexed_ids)
+                for alert_id in indexed_ids:
+                    if alert_id not in still_open:
+                        del open_alerts[alert_id]
+            index['high_water_usecs'] = high_water_usecs
+            index['open_alerts'] = open_alerts
+        _log.debug("Cluster ip = {}: merged {} changed alerts into {} open alerts".format(
+            self.args.cluster_vip, len(alerts_list), len(open_alerts)))
+
+        counts = dict((group, [0, 0, [], []]) for group in self.alert_groups())
+        with self.timer.span('count_alerts', alerts=len(open_alerts)):
+            for alert in sorted(open_alerts.values(), key=lambda a: a['latest_timestamp_usecs'], reverse=True):
+                self.count_alert(counts, self.alert_group(alert['category']), alert['severity'], alert['detail'])
+        return counts
+
+    def open_alert_ids(self, alert_ids):
+        """
+        Method to get which alerts of a list are still open critical or warning alerts
+        :param alert_ids(list): ids of the alerts
+        :return: set of the ids of the open alerts
+        """
+        still_open = set()
+        for first in range(0, len(alert_ids), self.ALERT_IDS_PAGE_SIZE):
+            alerts_list = self.query_alerts(alert_id_list=alert_ids[first:first + self.ALERT_IDS_PAGE_SIZE],
+                                            alert_state_list=AlertStateListEnum.KOPEN,
+                                            alert_severity_list=self.ALERT_SEVERITIES)
+            still_open.update(r.id for r in alerts_list)
+        return still_open
+
+    def alert_detail(self, alert):
+        """
+        Method to format an alert
+        :param alert(Alert): alert
+        :return: alert_detail(str): alert category, state, severity and occurrence time
+        """
+        return "AlertCategory:" + str(alert.alert_category[1:]) + \
+               ", AlertState:" + str(alert.alert_state[1:]) + \
+               ", Severity:" + str(alert.severity[1:]) + \
+               ", OccurrenceTime: " + \
+               str(self.epoch_to_date(alert.latest_timestamp_usecs))
 
     def probe(self):
         """
         Method to get the status
         :return: metric(str): nagios status.
         """
-        alerts = self.get_alerts()
-        critical = alerts[0]
-        warning = alerts[1]
-        if len(critical) > 0 or len(warning) > 0:
-            _log.info(
-                "Cluster ip = {}: ".format(self.args.cluster_vip) +
-                "There are {} alerts in critical".format(len(critical)) +
-                " status and {} ".format(len(warning)) + "alerts in warning" +
-                " status")
-            for alert in critical[0:5]:
-                _log.info(alert)
-            for alert in warning[0:5]:
-                _log.info(alert)
-        else:
-            _log.info(
-                "Cluster ip = {}: ".format(self.args.cluster_vip) +
-                "All alerts are in info status or no alerts")
+        counts = self.get_alerts()
+        metrics = []
+        for group in self.alert_groups():
+            num_critical, num_warning, critical, warning = counts[group]
+            prefix = "Cluster ip = {}: ".format(self.args.cluster_vip) + ("Category {}: ".format(group) if group else "")
+            if num_critical > 0 or num_warning > 0:
+                _log.info(
+                    prefix +
+                    "There are {} alerts in critical".format(num_critical) +
+                    " status and {} ".format(num_warning) + "alerts in warning" +
+                    " status")
+                for alert in critical:
+                    _log.info(alert)
+                for alert in warning:
+                    _log.info(alert)
+            else:
+                _log.info(prefix + "All alerts are in info status or no alerts")
 
-        if self.args.alert == '':
-            critical_metric = 'Critical Alerts'
-            warning_metric = 'Warning Alerts'
-        else:
-            critical_metric = 'Critical ' + self.args.alert + ' Alerts'
-            warning_metric = 'Warning ' + self.args.alert + ' Alerts'
-
-        metric_critical = nagiosplugin.Metric(
-            critical_metric,
-            len(critical),
-            min=0,
-            context='critical')
-
-        metric_warning = nagiosplugin.Metric(
-            warning_metric,
-            len(warning),
-            min=0,
-            context='warning')
-        return [metric_critical, metric_warning]
+            if group == '':
+                critical_metric = 'Critical Alerts'
+                warning_metric = 'Warning Alerts'
+            else:
+                critical_metric = 'Critical ' + group + ' Alerts'
+                warning_metric = 'Warning ' + group + ' Alerts'
+
+            metrics.append(nagiosplugin.Metric(
+                critical_metric,
+                num_critical,
+                min=0,
+                context=context_name('critical', group)))
+            metrics.append(nagiosplugin.Metric(
+                warning_metric,
+                num_warning,
+                min=0,
+                context=context_name('warning', group)))
+        return self.metrics(metrics)
 
     def epoch_to_date(self, epoch):
         """
@@ -175,45 +329,84 @@ class CohesityAlerts(nagiosplugin.Resource):
         return date
 
 
-def parse_args():
-    argp = argparse.ArgumentParser()
-    argp.add_argument('-ip', '--cluster_vip', required=True,
-                      help='Cohesity cluster ip or FQDN')
-    argp.add_argument('-n', '--host_name', required=True,
-                      help='Host name configured in Nagios')
-    argp.add_argument('-a', '--alert',
-                      default='', choices=['Disk', 'Node', 'Cluster', 'NodeHealth',
-                                           'ClusterHealth', 'BackupRestore', 'Encryption',
-                                           'ArchivalRestore', 'RemoteReplication',
-                                           'Quota', 'License', 'HeliosProActiveWellness',
-                                           'HeliosAnalyticsJobs', 'HeliosSignatureJobs', 'Security'],
-                      help='Alert category to be monitored on Cohesity cluster')
-    argp.add_argument('-f', '--auth_file', required=True,
-                      help='.ini file path with Cohesity cluster credentials')
-    argp.add_argument('-v', '--verbose', action='count', default=0, help='increase output'
-                                                                         ' verbosity (use up to 3 times)')
-    argp.add_argument('-t', '--timeout', default=30,
-                      help='abort execution after TIMEOUT seconds')
-    return argp.parse_args()
+def context_name(severity, group):
+    """
+    Method to get the nagios context of the critical or warning alert count of a group
+    :param severity(str): critical or warning
+    :param group(str): alert category name, '' for the alerts of all categories
+    :return: context name(str)
+    """
+    return severity + '_' + group if group else severity
+
+
+def alert_ranges(value):
+    """
+    Method to parse the thresholds of an alert category given as CATEGORY=CRITICAL_RANGE,WARNING_RANGE
+    :return: list(lst): of category, range of the critical alert count and range of the warning alert count
+    """
+    try:
+        category, ranges = value.split('=', 1)
+        critical, warning = ranges.split(',', 1)
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected CATEGORY=CRITICAL_RANGE,WARNING_RANGE, got ' + value)
+    if category not in ALERT_CATEGORIES:
+        raise argparse.ArgumentTypeError('invalid alert category {0} in {1}, choose from {2}'.format(
+            category, value, ', '.join(ALERT_CATEGORIES)))
+    for alert_range in (critical, warning):
+        try:
+            nagiosplugin.Range(alert_range)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError('invalid range {0} in {1}: {2}'.format(alert_range, value, e))
+    return [category, critical, warning]
+
+
+def parse_args(argv=None):
+    argp = argument_parser()
+    argp.add_argument('-a', '--alert', nargs='+',
+                      default=[], choices=ALERT_CATEGORIES + ['All'],
+                      help='Alert categories to be monitored on Cohesity cluster, each one is counted separately.'
+                           ' All counts every category separately')
+    argp.add_argument('--alert_ranges', nargs='+', type=alert_ranges, default=[],
+                      metavar='CATEGORY=CRITICAL_RANGE,WARNING_RANGE',
+                      help='ranges of the critical and warning alert counts of an alert category,'
+                           ' defaults to ~:0,~:0')
+    argp.add_argument('--incremental', action='store_true',
+                      help='fetch only the alerts changed since the last run and keep a local index of open alerts')
+    argp.add_argument('--alert_resync', type=int, default=3600,
+                      help='seconds after which the incremental alert index is rebuilt from all open alerts')
+    argp.add_argument('--count_only', action='store_true',
+                      help='get only the number of active alerts from the alert statistics, without'
+                           ' alert details; ignored with --alert')
+    return parse_check_args(argp, argv)
+
+
+def build_check(args):
+    """
+    Method to build the nagios check
+    :param args: commandline arguments
+    :return: check(nagiosplugin.Check)
+    """
+    alerts = CohesityAlerts(args)
+    check = new_check(alerts)
+    ranges = dict((category, [critical, warning]) for category, critical, warning in args.alert_ranges)
+    for group in alerts.alert_groups():
+        critical, warning = ranges.get(group, ['~:0', '~:0'])
+        check.add(
+            nagiosplugin.ScalarContext(
+                context_name('critical', group),
+                critical=critical
+            ))
+        check.add(
+            nagiosplugin.ScalarContext(
+                context_name('warning', group),
+                warning=warning
+            ))
+    return check
 
 
 @nagiosplugin.guarded
 def main():
-
-    args = parse_args()
-    check = nagiosplugin.Check(
-        CohesityAlerts(args))
-    check.add(
-        nagiosplugin.ScalarContext(
-            'critical',
-            critical='~:0'
-        ))
-    check.add(
-        nagiosplugin.ScalarContext(
-            'warning',
-            warning='~:0'
-        ))
-    check.main(args.verbose, args.timeout)
+    run('check_cohesity_alerts', parse_args, build_check)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# Copyright 2019 Cohesity Inc.
+# Author : Cohesity Developer <cohesity-api-sdks@cohesity.com>
+# This script is used to monitor the health of a Cohesity cluster with the metrics of all the other checks:
+# alerts, storage, metadata storage, node status, unprotected objects and protection runs. The checks share
+# one login and one fetch of the cluster information, and their calls to the cluster run in parallel.
+# Each check keeps its own thresholds, given with --<check>_args as the arguments of the check script.
+# The status is the worst status of the checks, UNKNOWN if one of them failed.
+# The log messages of the checks are logged again by the thread of the cluster health, check by check, so the
+# long output is the same when the cluster health runs in the check daemon, which only reports the log
+# messages of the thread of each check.
+# Usage :
+# python check_cohesity_cluster_health.py --cluster_vip 10.10.99.100 --host_name PaulCluster
+#                                         --auth_file /abc/def/config.ini
+#                                         --storage_args '-w ~:70 -c ~:90' --alerts_args '-a All'
+#
+
+import copy
+import importlib
+import logging
+import multiprocessing.pool
+import shlex
+import threading
+
+import nagiosplugin
+
+from cohesity_check_runtime import CohesityCheck, argument_parser, new_check, parse_check_args, run
+from cohesity_cluster_cache import SharedClusterSnapshot
+from cohesity_timing import TIMING_CONTEXT
+
+_log = logging.getLogger('nagiosplugin')
+
+# Name and script of the checks of the cluster health.
+COMPONENTS = (('alerts', 'check_cohesity_alerts'),
+              ('storage', 'check_cohesity_storage'),
+              ('metastorage', 'check_cohesity_metastorage'),
+              ('node_status', 'check_cohesity_node_status'),
+              ('objects_unprotected', 'check_cohesity_objects_unprotected'),
+              ('protection_runs', 'check_cohesity_protection_runs'))
+
+
+class ComponentLog(logging.Filter):
+    def __init__(self):
+        """
+        Method to initialize, the log records of the threads running a check are held back instead of logged
+        """
+        logging.Filter.__init__(self)
+        self.records = {}
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Method to hold back the log records of the current thread
+        """
+        with self.lock:
+            self.records[threading.current_thread().ident] = []
+
+    def stop(self):
+        """
+        Method to stop holding back the log records of the current thread
+        :return: list(lst): of the log records held back since start
+        """
+        with self.lock:
+            return self.records.pop(threading.current_thread().ident, [])
+
+    def filter(self, record):
+        with self.lock:
+            records = self.records.get(record.thread)
+            if records is None:
+                return True
+            records.append(record)
+            return False
+
+
+class ComponentFailed(nagiosplugin.Context):
+    def __init__(self, name):
+        super(ComponentFailed, self).__init__(name, fmt_metric='{name} check failed: {value}')
+
+    def evaluate(self, metric, resource):
+        return self.result_cls(nagiosplugin.Unknown, metric=metric)
+
+
+class CohesityClusterHealth(CohesityCheck):
+    def __init__(self, args):
+        """
+        Method to initialize
+        :param args: commandline arguments
+        """
+        super(CohesityClusterHealth, self).__init__(args)
+        cluster_snapshot = None
+        self.component_log = ComponentLog()
+        self.components = []
+        for name, check_name, component_args in args.components:
+            component_args.connection = self
+            check = importlib.import_module(check_name).build_check(component_args)
+            resource = check.resources[0]
+            if hasattr(resource, 'cluster_cache'):
+                # The storage checks read the same cluster information.
+                cluster_snapshot = cluster_snapshot or SharedClusterSnapshot(resource.cluster_cache)
+                resource.cluster_cache = cluster_snapshot
+            self.components.append([name, check])
+
+    @property
+    def name(self):
+        return 'COHESITY_CLUSTER_HEALTH'
+
+    def probe_component(self, component):
+        """
+        Method to run the probe of a check, in a thread of the pool
+        :param component(list): name and nagiosplugin.Check of the check
+        :return: list(lst): of the metrics of the check, with its contexts, and of its log records
+        """
+        name, check = component
+        self.component_log.start()
+        try:
+            with self.timer.span(name):
+                metrics = [metric.replace(context=name + '.' + metric.context)
+                           for metric in check.resources[0].probe() if metric.context != TIMING_CONTEXT]
+        except Exception as e:
+            _log.info("Cluster ip = {}: {} check failed: {}".format(self.args.cluster_vip, name, e))
+            metrics = [nagiosplugin.Metric(name, str(e), context='failed')]
+        finally:
+            records = self.component_log.stop()
+        return [metrics, records]
+
+    def probe(self):
+        """
+        Method to get the status
+        :return: metric(str): nagios status.
+        """
+        # The token is read or the login done once, before the checks call the cluster in parallel.
+        self.login.headers(timeout=self.cohesity_client.request_timeout())
+        pool = multiprocessing.pool.ThreadPool(min(self.args.workers, len(self.components)) or 1)
+        _log.addFilter(self.component_log)
+        try:
+            results = pool.map(self.probe_component, self.components)
+        finally:
+            pool.terminate()
+            _log.removeFilter(self.component_log)
+        for metrics, records in results:
+            for record in records:
+                _log.log(record.levelno, record.getMessage())
+        return self.metrics([metric for metrics, records in results for metric in metrics])
+
+
+def component_argv(args):
+    """
+    Method to get the commandline arguments the checks share
+    :return: argv(lst)
+    """
+    argv = ['--cluster_vip', args.cluster_vip, '--host_name', args.host_name, '--auth_file', args.auth_file,
+            '--token_cache', args.token_cache, '--timeout', str(args.timeout)]
+    if args.auth_key_file:
+        argv.extend(['--auth_key_file', args.auth_key_file])
+    return argv
+
+
+def parse_args(argv=None):
+    argp = argument_parser()
+    for name, check_name in COMPONENTS:
+        argp.add_argument('--' + name + '_args', default='', metavar='ARGS',
+                          help='arguments of {0}.py, like its thresholds'.format(check_name))
+    argp.add_argument('--skip', nargs='+', default=[], choices=[name for name, check_name in COMPONENTS],
+                      help='checks left out of the cluster health')
+    argp.add_argument('--workers', type=int, default=len(COMPONENTS),
+                      help='number of checks calling the cluster at the same time')
+    args = parse_check_args(argp, argv)
+    args.components = []
+    for name, check_name in COMPONENTS:
+        if name in args.skip:
+            continue
+        try:
+            component_args = importlib.import_module(check_name).parse_args(
+                component_argv(args) + shlex.split(getattr(args, name + '_args')))
+        except SystemExit:
+            argp.error('invalid --{0}_args: {1}'.format(name, getattr(args, name + '_args')))
+        args.components.append([name, check_name, component_args])
+    return args
+
+
+def build_check(args):
+    """
+    Method to build the nagios check
+    :param args: commandline arguments
+    :return: check(nagiosplugin.Check)
+    """
+    health = CohesityClusterHealth(args)
+    check = new_check(health)
+    check.add(ComponentFailed('failed'))
+    # The contexts of each check keep their thresholds under the name of the check.
+    for name, component_check in health.components:
+        for context_name in component_check.contexts:
+            if context_name in ('default', 'null', TIMING_CONTEXT):
+                continue
+            context = copy.copy(component_check.contexts[context_name])
+            context.name = name + '.' + context_name
+            check.add(context)
+    return check
+
+
+@nagiosplugin.guarded
+def main():
+    run('check_cohesity_cluster_health', parse_args, build_check)
+
+
+if __name__ == '__main__':
+    main()
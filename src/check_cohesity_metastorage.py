@@ -3,37 +3,36 @@
 # Author : Cohesity Developer <cohesity-api-sdks@cohesity.com>
 # This script is used to monitor the percentage of storage used for metadata
 # over the total storage available for metadata on Cohesity cluster
+# With --history the used metadata storage, its growth per day and its peak are computed from the usage history
+# of the cluster, fetched once an hour (see cohesity_usage_history.py).
 # Usage :
 # python check_cohesity_metastorage.py --cluster_vip 10.10.99.100 --host_name PaulCluster
 #                                              --auth_file /abc/def/config.ini -w 60 -c 90
+# python check_cohesity_metastorage.py --cluster_vip 10.10.99.100 --host_name PaulCluster
+#                                              --auth_file /abc/def/config.ini --history --growth_warning ~:0.5
 
 
-import argparse
-import configparser
 import logging
 import nagiosplugin
 
-from cohesity_management_sdk.cohesity_client import CohesityClient
 from cohesity_management_sdk.exceptions.api_exception import APIException
+from cohesity_check_runtime import CohesityCheck, argument_parser, new_check, parse_check_args, run
+from cohesity_cluster_cache import ClusterSnapshotCache, DEFAULT_CLUSTER_CACHE_TTL
+from cohesity_usage_history import (METADATA_METRIC, UsageHistory, add_history_args, add_history_contexts,
+                                    history_metrics)
 
 _log = logging.getLogger('nagiosplugin')
 
 
-class CohesityClusterStorage(nagiosplugin.Resource):
+class CohesityClusterStorage(CohesityCheck):
     def __init__(self, args):
         """
         Method to initialize
         :param args: commandline arguments
         """
-        parser = configparser.ConfigParser()
-        parser.read(args.auth_file)
-        self.cohesity_client = CohesityClient(cluster_vip=args.cluster_vip,
-                                              username=parser.get(
-                                                  args.host_name, 'username'),
-                                              password=parser.get(
-                                                  args.host_name, 'password'),
-                                              domain=parser.get(args.host_name, 'domain'))
-        self.args = args
+        super(CohesityClusterStorage, self).__init__(args)
+        self.cluster_cache = ClusterSnapshotCache(args.cluster_cache_ttl)
+        self.usage_history = UsageHistory(args.history_days, args.history_ttl)
 
     @property
     def name(self):
@@ -45,19 +44,40 @@ class CohesityClusterStorage(nagiosplugin.Resource):
         :return: list(lst): of available and used
         """
         try:
-            cluster_info = self.cohesity_client.cluster.get_cluster()
+            cluster_info = self.cluster_cache.get_cluster(self.login, self.cohesity_client)
             metadata_used = cluster_info.used_metadata_space_pct
         except APIException as e:
-            _log.debug("get cluster APIException raised: " + e)
+            _log.debug("get cluster APIException raised: " + str(e))
+            raise
 
         return metadata_used
 
+    def get_metadata_history(self):
+        """
+        Method to get the used metadata storage history of the cluster
+        :return: list(lst): of timestamp in milliseconds and used percent, oldest first
+        """
+        try:
+            points = self.usage_history.get_series(
+                self.login, self.cohesity_client, self.cluster_cache, self.args.history_metric)[0]
+        except APIException as e:
+            _log.debug("get metadata storage history APIException raised: " + str(e))
+            raise
+        if not points:
+            raise nagiosplugin.CheckError("No metadata storage usage history of {0} on cluster {1}".format(
+                self.args.history_metric, self.args.cluster_vip))
+        return points
+
     def probe(self):
         """
         Method to get the status
         :return: metric(str): nagios status.
         """
-        percent_used = int(self.get_cluster_storage())
+        if self.args.history:
+            percents = self.get_metadata_history()
+            percent_used = int(percents[-1][1])
+        else:
+            percent_used = int(self.get_cluster_storage())
         _log.info(
             "Cluster ip = {}: ".format(self.args.cluster_vip) +
             "Cluster Metadata storage is {0} % used".format(percent_used))
@@ -68,39 +88,44 @@ class CohesityClusterStorage(nagiosplugin.Resource):
             min=0,
             max=100,
             context='metadata_used')
-        return metric
+        metrics = [metric]
+        if self.args.history:
+            metrics.extend(history_metrics('metadata storage', percents))
+        return self.metrics(metrics)
 
 
-def parse_args():
-    argp = argparse.ArgumentParser()
-    argp.add_argument('-ip', '--cluster_vip', required=True,
-                      help='Cohesity cluster ip or FQDN')
-    argp.add_argument('-n', '--host_name', required=True,
-                      help='Host name configured in Nagios')
-    argp.add_argument('-f', '--auth_file', required=True,
-                      help='.ini file path with Cohesity cluster credentials')
+def parse_args(argv=None):
+    argp = argument_parser()
     argp.add_argument('-w', '--warning', metavar='RANGE', default='~:60', help='return warning if'
                                                                                ' occupancy is outside RANGE')
     argp.add_argument('-c', '--critical', metavar='RANGE', default='~:80', help='return critical if'
                                                                                 ' occupancy is outside RANGE')
-    argp.add_argument('-v', '--verbose', action='count', default=0, help='increase output verbosity'
-                                                                         ' (use up to 3 times)')
-    argp.add_argument('-t', '--timeout', default=30,
-                      help='abort execution after TIMEOUT seconds')
-    return argp.parse_args()
-
-
-@nagiosplugin.guarded
-def main():
-    args = parse_args()
-    check = nagiosplugin.Check(
-        CohesityClusterStorage(args))
+    argp.add_argument('--cluster_cache_ttl', type=int, default=DEFAULT_CLUSTER_CACHE_TTL,
+                      help='seconds the cluster information is shared with the other storage checks,'
+                           ' 0 to always fetch it')
+    add_history_args(argp, METADATA_METRIC)
+    return parse_check_args(argp, argv)
+
+
+def build_check(args):
+    """
+    Method to build the nagios check
+    :param args: commandline arguments
+    :return: check(nagiosplugin.Check)
+    """
+    check = new_check(CohesityClusterStorage(args))
     check.add(
         nagiosplugin.ScalarContext(
             'metadata_used',
             args.warning,
             args.critical))
-    check.main(args.verbose, args.timeout)
+    add_history_contexts(check, args)
+    return check
+
+
+@nagiosplugin.guarded
+def main():
+    run('check_cohesity_metastorage', parse_args, build_check)
 
 
 if __name__ == '__main__':
@@ -4,36 +4,31 @@
 # This script is used to find number of active nodes on a Cohesity cluster and status is
 #  OK - if number of inactive nodes is zero
 #  CRITICAL - if the number if inactive nodes is non zero
+#  WARNING - if the cluster status response ended before all the nodes were read
+# The nodes are read one at a time while the cluster status is received. The number of nodes and of down
+# services, and the down services of each node, are reported in the performance data.
 #
 # Usage :
 # python check_cohesity_node_status.py --cluster_vip 10.10.99.100 --host_name PaulCluster
 #                                      --auth_file /abc/def/config.ini
 #
 
-import argparse
-import configparser
-import json
 import logging
 import nagiosplugin
-import requests
 
 from cohesity_management_sdk.exceptions.api_exception import APIException
+from cohesity_check_runtime import CohesityCheck, argument_parser, new_check, parse_check_args, run
 
 _log = logging.getLogger('nagiosplugin')
 
 
-class CohesityNodeStatus(nagiosplugin.Resource):
+class CohesityNodeStatus(CohesityCheck):
     def __init__(self, args):
         """
         Method to initialize
         :param args: commandline arguments
         """
-        parser = configparser.ConfigParser()
-        parser.read(args.auth_file)
-        self.args = args
-        self.username = parser.get(args.host_name, 'username')
-        self.password = parser.get(args.host_name, 'password')
-        self.domain = parser.get(args.host_name, 'domain')
+        super(CohesityNodeStatus, self).__init__(args)
 
     @property
     def name(self):
@@ -41,61 +36,44 @@ class CohesityNodeStatus(nagiosplugin.Resource):
 
     def get_node_status(self):
         """
-        Method to get the cohesity node status
-        :return: node_list(lst): number of total and active nodes
+        Method to get the cohesity node status, the nodes are read one at a time while the response is received
+        :return: list(lst): of the nodes, with their id, ip, active flag and down services, and True if the
+                 response ended before all the nodes were read
         """
-        APIROOT = 'https://' + self.args.cluster_vip + '/irisservices/api/v1'
-        creds = json.dumps({
-            "domain": self.domain,
-            "password": self.password,
-            "username": self.username
-        })
-        HEADER = {
-            'accept': 'application/json',
-            'content-type': 'application/json'}
-        url = APIROOT + '/public/accessTokens'
         try:
-            response = requests.post(
-                url, data=creds, headers=HEADER, verify=False)
+            node_stats = self.login.call(self.cohesity_client.iter_json, '/nexus/cluster/status', key='nodeStatus')
         except APIException as e:
-            _log.debug("post request APIException raised: " + e)
-        if response != '':
-            if response.status_code == 201:
-                accessToken = response.json()['accessToken']
-                tokenType = response.json()['tokenType']
-                HEADER = {'accept': 'application/json',
-                          'content-type': 'application/json',
-                          'authorization': tokenType + ' ' + accessToken}
-        try:
-            response = requests.get(
-                APIROOT +
-                '/nexus/cluster/status',
-                headers=HEADER,
-                verify=False)
-        except APIException as e:
-            _log.debug("get cluster status APIException raised: " + e)
-        response = response.json()
-        node_stats = response["nodeStatus"]
-        num_nodes = 0
-        active_nodes = []
-        for nodes in node_stats:
-            num_nodes = num_nodes + 1
-            active_nodes.append(0)
-            if nodes['serviceStatus']:
-                for service in nodes['serviceStatus']:
-                    if len(service['processIds']) > 1:
-                        active_nodes[num_nodes - 1] = 1
-                        break
-        return active_nodes
+            _log.debug("get cluster status APIException raised: " + str(e))
+            raise
+        nodes = []
+        partial = False
+        with self.timer.span('count_nodes') as span:
+            try:
+                for node in node_stats:
+                    services = node.get('serviceStatus') or []
+                    nodes.append({'id': node.get('nodeId'),
+                                  'ip': node.get('nodeIp'),
+                                  'active': any(len(service.get('processIds') or []) > 1 for service in services),
+                                  'down_services': [service.get('service') for service in services
+                                                    if not service.get('processIds')]})
+            except (IOError, ValueError) as e:
+                # IncompleteJson, or the connection was lost while the response was read.
+                _log.debug("Cluster ip = {}: cluster status response ended after {} nodes: {}".format(
+                    self.args.cluster_vip, len(nodes), e))
+                partial = True
+            span['nodes'] = len(nodes)
+        if partial and not nodes:
+            raise nagiosplugin.CheckError("Incomplete cluster status response from {0}".format(self.args.cluster_vip))
+        return [nodes, partial]
 
     def probe(self):
         """
         Method to get the status
         :return: metric(str): nagios status.
         """
-        active_nodes = self.get_node_status()
-        num_nodes = len(active_nodes)
-        active_nodes = active_nodes.count(1)
+        nodes, partial = self.get_node_status()
+        num_nodes = len(nodes)
+        active_nodes = len([node for node in nodes if node['active']])
         bad_nodes = num_nodes - active_nodes
 
         if num_nodes == active_nodes:
@@ -105,39 +83,63 @@ class CohesityNodeStatus(nagiosplugin.Resource):
             _log.info(
                 "Cluster ip = {}: ".format(self.args.cluster_vip) +
                 "{0} of {1} nodes active on cluster".format(active_nodes, num_nodes))
+        if partial:
+            _log.info("Cluster ip = {}: ".format(self.args.cluster_vip) +
+                      "The cluster status response ended after {0} nodes".format(num_nodes))
 
-        metric = nagiosplugin.Metric(
+        metrics = [nagiosplugin.Metric(
             "Inactive nodes",
             bad_nodes,
             min=0,
-            context='bad_nodes')
-        return metric
-
-
-def parse_args():
-    argp = argparse.ArgumentParser()
-    argp.add_argument('-ip', '--cluster_vip', required=True,
-                      help='Cohesity cluster ip or FQDN')
-    argp.add_argument('-n', '--host_name', required=True,
-                      help='Host name configured in Nagios')
-    argp.add_argument('-f', '--auth_file', required=True,
-                      help='.ini file path with Cohesity cluster credentials')
-    argp.add_argument('-v', '--verbose', action='count', default=0, help='increase output verbosity'
-                                                                         ' (use up to 3 times)')
-    argp.add_argument('-t', '--timeout', default=30,
-                      help='abort execution after TIMEOUT seconds')
-    return argp.parse_args()
+            context='bad_nodes')]
+        metrics.append(nagiosplugin.Metric("Nodes", num_nodes, min=0, context='nodes'))
+        metrics.append(nagiosplugin.Metric(
+            "Down services",
+            sum(len(node['down_services']) for node in nodes),
+            min=0,
+            context='down_services'))
+        for node in nodes:
+            if node['active'] and not node['down_services']:
+                continue
+            node_name = node['ip'] or str(node['id'])
+            if not node['active']:
+                _log.info("Node {0} (id {1}) is inactive".format(node_name, node['id']))
+            if node['down_services']:
+                _log.info("Node {0} (id {1}) services down: {2}".format(
+                    node_name, node['id'], ', '.join(str(service) for service in node['down_services'])))
+                metrics.append(nagiosplugin.Metric(
+                    "Down services on node " + node_name,
+                    len(node['down_services']),
+                    min=0,
+                    context='down_services'))
+        metrics.append(nagiosplugin.Metric("Partial status response", int(partial), min=0, context='partial'))
+        return self.metrics(metrics)
+
+
+def parse_args(argv=None):
+    argp = argument_parser()
+    return parse_check_args(argp, argv)
+
+
+def build_check(args):
+    """
+    Method to build the nagios check
+    :param args: commandline arguments
+    :return: check(nagiosplugin.Check)
+    """
+    check = new_check(CohesityNodeStatus(args))
+    check.add(nagiosplugin.ScalarContext('bad_nodes',
+                                         critical='~:0'))
+    check.add(nagiosplugin.ScalarContext('nodes'))
+    check.add(nagiosplugin.ScalarContext('down_services'))
+    check.add(nagiosplugin.ScalarContext('partial',
+                                         warning='~:0'))
+    return check
 
 
 @nagiosplugin.guarded
 def main():
-
-    args = parse_args()
-    check = nagiosplugin.Check(
-        CohesityNodeStatus(args))
-    check.add(nagiosplugin.ScalarContext('bad_nodes',
-                                         critical='~:0'))
-    check.main(args.verbose, args.timeout)
+    run('check_cohesity_node_status', parse_args, build_check)
 
 
 if __name__ == '__main__':
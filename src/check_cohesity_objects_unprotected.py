@@ -5,38 +5,34 @@
 #     OK - if the percentage of unprotected objects are within the warning threshold
 #     WARNING -if the percentage of unprotected objects are is above the warning threshold
 # The default warning threshold is 90
+# The percentage of unprotected objects of each environment (VMware, SQL, NAS...) is reported as well,
+# from the same registration info. --lean does not ask the cluster for the permissions of the entities and
+# --registration_cache_ttl reuses the registration info of the cluster for that many seconds.
 # Usage :
 # python check_cohesity_objects_unprotected.py --cluster_vip 10.10.99.100 --host_name PaulCluster
 #                                              --auth_file /abc/def/config.ini -w 60
+#                                              --lean --registration_cache_ttl 300 --env_warning ~:95
 #
 
 
-import argparse
-import configparser
 import logging
 import nagiosplugin
 
-from cohesity_management_sdk.cohesity_client import CohesityClient
 from cohesity_management_sdk.exceptions.api_exception import APIException
+from cohesity_check_runtime import CohesityCheck, argument_parser, new_check, parse_check_args, run
+from cohesity_cluster_cache import DEFAULT_REGISTRATION_CACHE_TTL, RegistrationStatsCache
 
 _log = logging.getLogger('nagiosplugin')
 
 
-class CohesityObjects(nagiosplugin.Resource):
+class CohesityObjects(CohesityCheck):
     def __init__(self, args):
         """
         Method to initialize
         :param args: commandline arguments
         """
-        parser = configparser.ConfigParser()
-        parser.read(args.auth_file)
-        self.cohesity_client = CohesityClient(cluster_vip=args.cluster_vip,
-                                              username=parser.get(
-                                                  args.host_name, 'username'),
-                                              password=parser.get(
-                                                  args.host_name, 'password'),
-                                              domain=parser.get(args.host_name, 'domain'))
-        self.args = args
+        super(CohesityObjects, self).__init__(args)
+        self.registration_cache = RegistrationStatsCache(args.registration_cache_ttl, args.lean)
 
     @property
     def name(self):
@@ -45,23 +41,25 @@ class CohesityObjects(nagiosplugin.Resource):
     def get_object(self):
         """
         Method to get the cohesity objects protected and not protected
-        :return: list(lst): of protected and not protected
+        :return: list(lst): of protected and not protected, and of the environment, protected and not
+                 protected of each environment
         """
         try:
-            object_list = self.cohesity_client.protection_sources.\
-                list_protection_sources_registration_info(
-                    include_entity_permission_info=True)
+            stats = self.registration_cache.get_stats_by_env(self.login, self.cohesity_client)
         except APIException as e:
-            _log.debug("get protection sources APIException raised: " + e)
+            _log.debug("get protection sources APIException raised: " + str(e))
+            raise
         protected = 0
         unprotected = 0
-        stats = object_list.stats_by_env
-        if stats:
-            for r in stats:
-                protected = r.protected_count + protected
-                unprotected = r.unprotected_count + unprotected
+        environments = []
+        for r in stats:
+            protected = (r.get('protectedCount') or 0) + protected
+            unprotected = (r.get('unprotectedCount') or 0) + unprotected
+            environments.append([r.get('environment') or 'kUnknown',
+                                 r.get('protectedCount') or 0,
+                                 r.get('unprotectedCount') or 0])
 
-        return [protected, unprotected]
+        return [protected, unprotected, environments]
 
     def probe(self):
         """
@@ -69,51 +67,71 @@ class CohesityObjects(nagiosplugin.Resource):
         :return: metric(str): nagios status.
         """
         objects = self.get_object()
-        total_protected = float(objects[0]) + float(objects[1])
-        unprotected_objects = objects[1]
-        if not total_protected == 0:
-            percent_unprotected = int(
-                float(unprotected_objects) /
-                float(total_protected) *
-                100)
-        else:
-            percent_unprotected = 0
+        percent_unprotected = percent_of(objects[0], objects[1])
         _log.info("Cluster ip = {}: ".format(self.args.cluster_vip) +
                   "Percentage of sources unprotected {0} %".format(percent_unprotected))
-        metric = nagiosplugin.Metric(
+        metrics = [nagiosplugin.Metric(
             "Percentage of sources unprotected",
             percent_unprotected,
             '%',
             min=0,
             max=100,
-            context='unprotected')
-        return metric
-
-
-def parse_args():
-    argp = argparse.ArgumentParser()
-    argp.add_argument('-ip', '--cluster_vip', required=True,
-                      help='Cohesity cluster ip or FQDN')
-    argp.add_argument('-n', '--host_name', required=True,
-                      help='Host name configured in Nagios')
-    argp.add_argument('-f', '--auth_file', required=True,
-                      help='.ini file path with Cohesity cluster credentials')
+            context='unprotected')]
+        for environment, protected, unprotected in objects[2]:
+            if protected + unprotected == 0:
+                continue
+            # kVMware is reported as VMware.
+            if environment.startswith('k'):
+                environment = environment[1:]
+            metrics.append(nagiosplugin.Metric(
+                "Percentage of {0} sources unprotected".format(environment),
+                percent_of(protected, unprotected),
+                '%',
+                min=0,
+                max=100,
+                context='env_unprotected'))
+        return self.metrics(metrics)
+
+
+def percent_of(protected, unprotected):
+    """
+    Method to get the percentage of unprotected objects
+    :return: percent(int): 0 without objects
+    """
+    total = float(protected) + float(unprotected)
+    if total == 0:
+        return 0
+    return int(float(unprotected) / total * 100)
+
+
+def parse_args(argv=None):
+    argp = argument_parser()
     argp.add_argument('-w', '--warning', metavar='RANGE', default='~:90', help='return warning if'
                                                                                ' occupancy is outside RANGE')
-    argp.add_argument('-v', '--verbose', action='count', default=0, help='increase output verbosity'
-                                                                         ' (use up to 3 times)')
-    argp.add_argument('-t', '--timeout', default=30,
-                      help='abort execution after TIMEOUT seconds')
-    return argp.parse_args()
+    argp.add_argument('--env_warning', metavar='RANGE', help='return warning if the occupancy of an environment'
+                                                             ' is outside RANGE')
+    argp.add_argument('--lean', action='store_true',
+                      help='do not get the permissions of the entities, only the stats of the environments')
+    argp.add_argument('--registration_cache_ttl', type=int, default=DEFAULT_REGISTRATION_CACHE_TTL,
+                      help='seconds the registration info of the cluster is reused, 0 disables the cache')
+    return parse_check_args(argp, argv)
+
+
+def build_check(args):
+    """
+    Method to build the nagios check
+    :param args: commandline arguments
+    :return: check(nagiosplugin.Check)
+    """
+    check = new_check(CohesityObjects(args))
+    check.add(nagiosplugin.ScalarContext('unprotected', args.warning))
+    check.add(nagiosplugin.ScalarContext('env_unprotected', args.env_warning))
+    return check
 
 
 @nagiosplugin.guarded
 def main():
-    args = parse_args()
-    check = nagiosplugin.Check(
-        CohesityObjects(args))
-    check.add(nagiosplugin.ScalarContext('unprotected', args.warning))
-    check.main(args.verbose, args.timeout)
+    run('check_cohesity_objects_unprotected', parse_args, build_check)
 
 
 if __name__ == '__main__':
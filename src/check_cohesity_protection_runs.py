@@ -13,85 +13,269 @@
 #                                               --auth_file /abc/def/config.ini -w 60 -c 90
 #
 
-import argparse
-import configparser
 import datetime
 import logging
 import nagiosplugin
+import os
 import time
 
-from cohesity_management_sdk.cohesity_client import CohesityClient
 from cohesity_management_sdk.exceptions.api_exception import APIException
 from cohesity_management_sdk.models.status_backup_run_enum import StatusBackupRunEnum
 from cohesity_management_sdk.models.status_copy_run_enum import StatusCopyRunEnum
+from cohesity_check_runtime import CohesityCheck, argument_parser, new_check, parse_check_args, run
+from cohesity_token_cache import STATE_DIR, state_file
 
 _log = logging.getLogger('nagiosplugin')
 
 
-class CohesityProtectionStatus(nagiosplugin.Resource):
+class CohesityProtectionStatus(CohesityCheck):
     def __init__(self, args):
         """
         Method to initialize
         :param args: commandline arguments
         """
-        parser = configparser.ConfigParser()
-        parser.read(args.auth_file)
-        self.cohesity_client = CohesityClient(cluster_vip=args.cluster_vip,
-                                              username=parser.get(
-                                                  args.host_name, 'username'),
-                                              password=parser.get(
-                                                  args.host_name, 'password'),
-                                              domain=parser.get(args.host_name, 'domain'))
-        self.args = args
+        super(CohesityProtectionStatus, self).__init__(args)
         self.SECONDS_TO_MICROSECONDS = 1000000
         self.SECONDS_IN_DAY = 86400
-        self.NUMBER_OF_RUNS = 1000000000000
+        self.RUNS_PAGE_SIZE = 100
+        self.RUNNING_STATUS = (StatusBackupRunEnum.KACCEPTED, StatusBackupRunEnum.KRUNNING,
+                               StatusBackupRunEnum.KCANCELING)
+        # Seconds the nagios server clock may be ahead of the cluster clock
+        self.CLOCK_SKEW = 600
+        # The scan stopped above the critical threshold, the number of failed runs is a lower bound
+        self.scan_stopped = False
 
     @property
     def name(self):
         return 'COHESITY_PROTECTION_RUN_STATUS'
 
+    def protection_runs(self, start_time_usecs, job_start_usecs=None):
+        """
+        Method to get the protection runs started since a time, running or completed, job by job.
+        :param start_time_usecs(int): start of the time window in microseconds
+        :param job_start_usecs(dict): later start of the time window of some jobs, by job id
+        :return: generator of protection runs, newest first for each job
+        """
+        import multiprocessing.pool
+
+        protection_jobs = self.login.call(self.cohesity_client.get_protection_jobs,
+                                          include_last_run_and_stats=True)
+        job_windows = []
+        for protection_job in protection_jobs:
+            job_start_time_usecs = max(start_time_usecs,
+                                       (job_start_usecs or {}).get(str(protection_job.id), start_time_usecs))
+            last_run_usecs = self.last_run_start_usecs(protection_job)
+            if last_run_usecs is not None and last_run_usecs < job_start_time_usecs:
+                # The last run of the job started before the time window, none of its runs are in it.
+                continue
+            job_windows.append([protection_job.id, job_start_time_usecs])
+        if not job_windows:
+            return
+        _log.debug("Cluster ip = {}: fetching the protection runs of {} of {} jobs".format(
+            self.args.cluster_vip, len(job_windows), len(protection_jobs)))
+        # The runs of the first job are checked while they are received, a scan that stops on them sends no
+        # other request.
+        for protection_runs in self.job_runs(*job_windows[0]):
+            yield protection_runs
+        if len(job_windows) == 1:
+            return
+        # The pages of a job follow each other, the other jobs are fetched at the same time and returned in order.
+        pool = multiprocessing.pool.ThreadPool(min(self.args.workers, len(job_windows) - 1) or 1)
+        try:
+            for job_protection_runs in pool.imap(self.job_run_list, job_windows[1:]):
+                for protection_runs in job_protection_runs:
+                    yield protection_runs
+        finally:
+            pool.terminate()
+
+    def last_run_start_usecs(self, protection_job):
+        """
+        Method to get the start time of the last run of a protection job
+        :param protection_job(ProtectionJob): protection job with its last run
+        :return: start_time_usecs(int): None when the job record has no last run
+        """
+        last_run = protection_job.last_run
+        if last_run is None or last_run.backup_run is None or last_run.backup_run.stats is None:
+            return None
+        return last_run.backup_run.stats.start_time_usecs
+
+    def job_run_list(self, job_window):
+        """
+        Method to get all the protection runs of a job in its time window, in a thread of the pool
+        :param job_window(list): id of the protection job and start of its time window in microseconds
+        :return: list(lst): of protection runs, newest first
+        """
+        return list(self.job_runs(*job_window))
+
+    def job_runs(self, job_id, start_time_usecs):
+        """
+        Method to get the protection runs of a job started since a time, one page at a time.
+        The runs of a page are decoded one at a time while the page is received.
+        :param job_id(int): id of the protection job
+        :param start_time_usecs(int): start of the time window in microseconds
+        :return: generator of protection runs, newest first
+        """
+        # The end time only returns the completed runs, the first page has none so the running runs are returned.
+        end_time_usecs = None
+        while end_time_usecs is None or end_time_usecs >= start_time_usecs:
+            protection_runs_page = self.login.call(
+                self.cohesity_client.iter_protection_runs,
+                job_id=job_id,
+                start_time_usecs=start_time_usecs,
+                end_time_usecs=end_time_usecs,
+                num_runs=self.RUNS_PAGE_SIZE,
+                exclude_tasks=True)
+            num_runs = 0
+            oldest_start_usecs = None
+            for protection_runs in protection_runs_page:
+                num_runs = num_runs + 1
+                if protection_runs.backup_run is None or protection_runs.backup_run.stats is None:
+                    # A run without stats has no start time, it is not a run of the time window.
+                    continue
+                run_start_usecs = protection_runs.backup_run.stats.start_time_usecs
+                oldest_start_usecs = min(oldest_start_usecs or run_start_usecs, run_start_usecs)
+                yield protection_runs
+            if num_runs < self.RUNS_PAGE_SIZE or oldest_start_usecs is None:
+                return
+            # The end time filters on the completion of the runs. The runs of a job do not overlap, the older
+            # runs of the job completed before the oldest run of this page started.
+            end_time_usecs = oldest_start_usecs - 1
+
+    def run_failures(self, protection_runs):
+        """
+        Method to get the failures of a protection run
+        :param protection_runs(ProtectionRunInstance): protection run
+        :return: list(lst): of backup run and copy run failure details, None when the run did not fail
+        """
+        backup_run_details = None
+        copy_run_details = None
+        try:
+            if protection_runs.backup_run.status == (
+                    StatusBackupRunEnum.KFAILURE):
+                backup_run_details = 'Job Name: ' + protection_runs.job_name + \
+                    ' Type: Backup run' + \
+                    ', Error: ' + protection_runs.backup_run.error
+            if len(protection_runs.copy_run) > 1:
+                for protection_copy_run in protection_runs.copy_run[1:]:
+                    if protection_copy_run.status == StatusCopyRunEnum.KFAILURE:
+                        copy_run_details = 'Job Name: ' + protection_runs.job_name + \
+                                           ' Type: Copy run' + \
+                                           ', Error: ' + protection_copy_run.error
+                        break
+        except TypeError as e:
+            _log.debug("Cluster ip = {}: incomplete protection run of {}: {}".format(
+                self.args.cluster_vip, protection_runs.job_name, str(e)))
+        return [backup_run_details, copy_run_details]
+
+    def run_in_progress(self, protection_runs):
+        """
+        Method to check if the backup run or one of the copy runs of a protection run is not finished
+        :param protection_runs(ProtectionRunInstance): protection run
+        :return: bool
+        """
+        if protection_runs.backup_run.status in self.RUNNING_STATUS:
+            return True
+        return any(protection_copy_run.status in self.RUNNING_STATUS
+                   for protection_copy_run in protection_runs.copy_run or [])
+
     def failed_backup_runs(self):
         """
-        Method to get the protection run status
+        Method to get the protection run status.
+        The scan stops as soon as the number of failed runs is above the critical threshold, the failed runs
+        are then at least the ones returned.
         :return: number of passed and failed protection runs
         """
-        try:
-            # current timestamp in microseconds
-            end_time_usecs = int(time.time() * self.SECONDS_TO_MICROSECONDS)
-
-            # start timestamp in microseconds
-            start_time_usecs = int((time.time() - int(self.args.days) *
-                                    self.SECONDS_IN_DAY) * self.SECONDS_TO_MICROSECONDS)
-            protection_runs_list = self.cohesity_client.\
-                protection_runs.get_protection_runs(start_time_usecs=start_time_usecs,
-                                                    end_time_usecs=end_time_usecs,
-                                                    num_runs=self.NUMBER_OF_RUNS)
-        except APIException as e:
-            _log.debug("get protection runs APIException raised: " + e)
+        if self.args.incremental:
+            return self.failed_backup_runs_incremental()
+        # start timestamp in microseconds
+        start_time_usecs = int((time.time() - int(self.args.days) *
+                                self.SECONDS_IN_DAY) * self.SECONDS_TO_MICROSECONDS)
+        critical = nagiosplugin.Range(self.args.critical)
         failed_backup_runs = []
         failed_copy_runs = []
 
-        for protection_runs in protection_runs_list:
-            if protection_runs.job_name.startswith("_DELETED"):
-                continue
+        try:
+            # The requests for the pages are timed on their own.
+            with self.timer.span('scan_runs'):
+                for protection_runs in self.protection_runs(start_time_usecs):
+                    if protection_runs.job_name.startswith("_DELETED"):
+                        continue
+                    backup_run_details, copy_run_details = self.run_failures(protection_runs)
+                    if backup_run_details:
+                        failed_backup_runs.append(backup_run_details)
+                    if copy_run_details:
+                        failed_copy_runs.append(copy_run_details)
+                    if not critical.invert and len(failed_backup_runs) + len(failed_copy_runs) > critical.end:
+                        _log.debug("Cluster ip = {}: critical threshold exceeded, stopped the protection run"
+                                   " scan".format(self.args.cluster_vip))
+                        self.scan_stopped = True
+                        break
+        except APIException as e:
+            _log.debug("get protection runs APIException raised: " + str(e))
+            raise
+        return [failed_backup_runs, failed_copy_runs]
+
+    def failed_backup_runs_incremental(self):
+        """
+        Method to get the protection run status from a local index of the failed runs.
+        Each job has a checkpoint: its runs that started before the checkpoint are finished and already indexed.
+        Only the runs of each job newer than its checkpoint are fetched, and failures older than the time window
+        are dropped from the index.
+        :return: number of passed and failed protection runs
+        """
+        now = time.time()
+        start_time_usecs = int((now - int(self.args.days) *
+                                self.SECONDS_IN_DAY) * self.SECONDS_TO_MICROSECONDS)
+        # Runs that start after the scan may be dated before it by the cluster clock
+        scan_end_usecs = int((now - self.CLOCK_SKEW) * self.SECONDS_TO_MICROSECONDS)
+        path = os.path.join(STATE_DIR, 'protection_runs_{0}.json'.format(
+            self.args.cluster_vip.replace(os.sep, '_')))
+
+        with state_file(path) as index:
+            if index.get('days') != int(self.args.days):
+                index.clear()
+                index['days'] = int(self.args.days)
+            failures = index.get('failures', {})
+            checkpoints = index.get('checkpoints', {})
+            new_checkpoints = dict((job_id, scan_end_usecs) for job_id in checkpoints)
+            num_runs = 0
             try:
-                if protection_runs.backup_run.status == (
-                        StatusBackupRunEnum.KFAILURE):
-                    backup_run_details = 'Job Name: ' + protection_runs.job_name + \
-                        ' Type: Backup run' + \
-                        ', Error: ' + protection_runs.backup_run.error
-                    failed_backup_runs.append(backup_run_details)
-                if len(protection_runs.copy_run) > 1:
-                    for protection_copy_run in protection_runs.copy_run[1:]:
-                        if protection_copy_run.status == StatusCopyRunEnum.KFAILURE:
-                            copy_run_details = 'Job Name: ' + protection_runs.job_name + \
-                                               ' Type: Copy run' + \
-                                               ', Error: ' + protection_copy_run.error
-                            failed_copy_runs.append(copy_run_details)
-                            break
-            except TypeError as e:
-                print("Error" + str(e))
+                with self.timer.span('scan_runs'):
+                    for protection_runs in self.protection_runs(start_time_usecs, checkpoints):
+                        job_id = str(protection_runs.job_id)
+                        run_start_usecs = protection_runs.backup_run.stats.start_time_usecs
+                        new_checkpoints.setdefault(job_id, scan_end_usecs)
+                        if run_start_usecs < checkpoints.get(job_id, 0):
+                            continue
+                        num_runs = num_runs + 1
+                        if self.run_in_progress(protection_runs):
+                            new_checkpoints[job_id] = min(new_checkpoints[job_id], run_start_usecs)
+                        key = job_id + ':' + str(run_start_usecs)
+                        failures.pop(key, None)
+                        if protection_runs.job_name.startswith("_DELETED"):
+                            continue
+                        backup_run_details, copy_run_details = self.run_failures(protection_runs)
+                        if backup_run_details or copy_run_details:
+                            failures[key] = {'start_time_usecs': run_start_usecs,
+                                             'backup': backup_run_details,
+                                             'copy': copy_run_details}
+            except APIException as e:
+                _log.debug("get protection runs APIException raised: " + str(e))
+                raise
+            for key in [k for k, v in failures.items() if v['start_time_usecs'] < start_time_usecs]:
+                del failures[key]
+            index['failures'] = failures
+            index['checkpoints'] = new_checkpoints
+        _log.debug("Cluster ip = {}: merged {} new protection runs, {} failed runs in the index".format(
+            self.args.cluster_vip, num_runs, len(failures)))
+
+        failed_backup_runs = []
+        failed_copy_runs = []
+        for failure in sorted(failures.values(), key=lambda f: f['start_time_usecs'], reverse=True):
+            if failure['backup']:
+                failed_backup_runs.append(failure['backup'])
+            if failure['copy']:
+                failed_copy_runs.append(failure['copy'])
         return [failed_backup_runs, failed_copy_runs]
 
     def probe(self):
@@ -107,7 +291,8 @@ class CohesityProtectionStatus(nagiosplugin.Resource):
         else:
             _log.info(
                 "Cluster ip = {}: ".format(self.args.cluster_vip) +
-                "In the past " + str(self.args.days) + " days, there are " + str(len(failed_runs[0])) +
+                "In the past " + str(self.args.days) + " days, there are " +
+                ("at least " if self.scan_stopped else "") + str(len(failed_runs[0])) +
                 " backup run failures and " + str(len(failed_runs[1])) + " copy run failures")
             for backup_run in failed_runs[0][0:5]:
                 _log.info(backup_run)
@@ -120,7 +305,16 @@ class CohesityProtectionStatus(nagiosplugin.Resource):
             len(failed_runs[0]) + len(failed_runs[1]),
             min=0,
             context='failed_runs')
-        return metric
+        return self.metrics([metric])
+
+    def describe_failed_runs(self, metric, context):
+        """
+        Method to describe the number of failed runs, a lower bound when the scan stopped early
+        :param metric(nagiosplugin.Metric): number of failed runs
+        :param context(nagiosplugin.Context): context of the metric
+        :return: description(str)
+        """
+        return '{0} is {1}{2}'.format(metric.name, 'at least ' if self.scan_stopped else '', metric.valueunit)
 
     def epoch_to_date(self, epoch):
         """
@@ -132,38 +326,42 @@ class CohesityProtectionStatus(nagiosplugin.Resource):
         return date
 
 
-def parse_args():
-    argp = argparse.ArgumentParser()
-    argp.add_argument('-ip', '--cluster_vip', required=True,
-                      help='Cohesity cluster ip or FQDN')
-    argp.add_argument('-n', '--host_name', required=True,
-                      help='Host name configured in Nagios')
-    argp.add_argument('-f', '--auth_file', required=True,
-                      help='.ini file path with Cohesity cluster credentials')
+def parse_args(argv=None):
+    argp = argument_parser()
     argp.add_argument('-d', '--days', default=1,
                       help='The number of days of protection runs to monitor')
+    argp.add_argument('--incremental', action='store_true',
+                      help='fetch only the protection runs started since the last run and keep a local index'
+                           ' of failed runs')
+    argp.add_argument('--workers', type=int, default=8,
+                      help='number of protection jobs whose runs are fetched at the same time')
     argp.add_argument('-w', '--warning', metavar='RANGE', default='~:0', help='return warning if'
                                                                               ' occupancy is outside RANGE')
     argp.add_argument('-c', '--critical', metavar='RANGE', default='~:0', help='return critical if'
                                                                                ' occupancy is outside RANGE')
-    argp.add_argument('-v', '--verbose', action='count', default=0, help='increase output'
-                                                                         ' verbosity (use up to 3 times)')
-    argp.add_argument('-t', '--timeout', default=30,
-                      help='abort execution after TIMEOUT seconds')
-    return argp.parse_args()
+    return parse_check_args(argp, argv)
 
 
-@nagiosplugin.guarded
-def main():
-    args = parse_args()
-    check = nagiosplugin.Check(
-        CohesityProtectionStatus(args))
+def build_check(args):
+    """
+    Method to build the nagios check
+    :param args: commandline arguments
+    :return: check(nagiosplugin.Check)
+    """
+    protection_status = CohesityProtectionStatus(args)
+    check = new_check(protection_status)
     check.add(
         nagiosplugin.ScalarContext(
             'failed_runs',
             args.warning,
-            args.critical))
-    check.main(args.verbose, args.timeout)
+            args.critical,
+            fmt_metric=protection_status.describe_failed_runs))
+    return check
+
+
+@nagiosplugin.guarded
+def main():
+    run('check_cohesity_protection_runs', parse_args, build_check)
 
 
 if __name__ == '__main__':
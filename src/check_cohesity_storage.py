@@ -9,38 +9,44 @@
 #          percent used =  -------------- * 100
 #                          total_capacity
 #
+# With --history the used storage, its growth per day and its peak are computed from the usage history of
+# the cluster, fetched once an hour (see cohesity_usage_history.py).
+# With --forecast the used storage is also kept in a local time series and the days until the storage is full
+# are forecast from its trend (see cohesity_storage_trend.py).
+#
 # Usage :
 # python check_cohesity_storage.py --cluster_vip 10.10.99.100 --host_name PaulCluster
 #                                              --auth_file /abc/def/config.ini -w 60 -c 90
+# python check_cohesity_storage.py --cluster_vip 10.10.99.100 --host_name PaulCluster
+#                                              --auth_file /abc/def/config.ini --forecast --days_warning 60:
+# python check_cohesity_storage.py --cluster_vip 10.10.99.100 --host_name PaulCluster
+#                                              --auth_file /abc/def/config.ini --history --growth_warning ~:0.5
 #
 
 
-import argparse
-import configparser
 import logging
 import nagiosplugin
+import time
 
-from cohesity_management_sdk.cohesity_client import CohesityClient
 from cohesity_management_sdk.exceptions.api_exception import APIException
+from cohesity_check_runtime import CohesityCheck, argument_parser, new_check, parse_check_args, run
+from cohesity_cluster_cache import ClusterSnapshotCache, DEFAULT_CLUSTER_CACHE_TTL
+from cohesity_storage_trend import DEFAULT_SAMPLE_INTERVAL, DEFAULT_SLOTS, StorageTrend
+from cohesity_usage_history import (STORAGE_METRIC, UsageHistory, add_history_args, add_history_contexts,
+                                    history_metrics)
 
 _log = logging.getLogger('nagiosplugin')
 
 
-class CohesityClusterStorage(nagiosplugin.Resource):
+class CohesityClusterStorage(CohesityCheck):
     def __init__(self, args):
         """
         Method to initialize
         :param args: commandline arguments
         """
-        parser = configparser.ConfigParser()
-        parser.read(args.auth_file)
-        self.cohesity_client = CohesityClient(cluster_vip=args.cluster_vip,
-                                              username=parser.get(
-                                                  args.host_name, 'username'),
-                                              password=parser.get(
-                                                  args.host_name, 'password'),
-                                              domain=parser.get(args.host_name, 'domain'))
-        self.args = args
+        super(CohesityClusterStorage, self).__init__(args)
+        self.cluster_cache = ClusterSnapshotCache(args.cluster_cache_ttl)
+        self.usage_history = UsageHistory(args.history_days, args.history_ttl)
 
     @property
     def name(self):
@@ -52,21 +58,42 @@ class CohesityClusterStorage(nagiosplugin.Resource):
         :return: list(lst): of available and used
         """
         try:
-            cluster_info = self.cohesity_client.cluster.get_cluster(
-                fetch_stats=True)
+            cluster_info = self.cluster_cache.get_cluster(self.login, self.cohesity_client)
         except APIException as e:
-            _log.debug("get cluster APIException raised: " + e)
+            _log.debug("get cluster APIException raised: " + str(e))
+            raise
         used_storage = cluster_info.stats.usage_perf_stats.\
             total_physical_usage_bytes
         total_storage = cluster_info.stats.usage_perf_stats.physical_capacity_bytes
         return [used_storage, total_storage]
 
+    def get_storage_history(self):
+        """
+        Method to get the used storage history of the cluster
+        :return: list(lst): of the points, timestamp in milliseconds and used percent, and the storage used and
+                 total storage available at the newest point
+        """
+        try:
+            points, total_storage = self.usage_history.get_series(
+                self.login, self.cohesity_client, self.cluster_cache, self.args.history_metric)
+        except APIException as e:
+            _log.debug("get storage history APIException raised: " + str(e))
+            raise
+        if not points:
+            raise nagiosplugin.CheckError("No storage usage history of {0} on cluster {1}".format(
+                self.args.history_metric, self.args.cluster_vip))
+        percents = [[timestamp, float(used) / float(total_storage) * 100] for timestamp, used in points]
+        return [percents, [points[-1][1], total_storage]]
+
     def probe(self):
         """
         Method to get the status
         :return: metric(str): nagios status.
         """
-        storage = self.get_cluster_storage()
+        if self.args.history:
+            percents, storage = self.get_storage_history()
+        else:
+            storage = self.get_cluster_storage()
         percent_used = int((float(storage[0]) / float(storage[1])) * 100)
 
         _log.info("Cluster ip = {}: ".format(self.args.cluster_vip) +
@@ -78,39 +105,74 @@ class CohesityClusterStorage(nagiosplugin.Resource):
             min=0,
             max=100,
             context='cluster_used_storage')
-        return metric
-
-
-def parse_args():
-    argp = argparse.ArgumentParser()
-    argp.add_argument('-ip', '--cluster_vip', required=True,
-                      help='Cohesity cluster ip or FQDN')
-    argp.add_argument('-n', '--host_name', required=True,
-                      help='Host name configured in Nagios')
-    argp.add_argument('-f', '--auth_file', required=True,
-                      help='.ini file path with Cohesity cluster credentials')
+        metrics = [metric]
+        if self.args.history:
+            metrics.extend(history_metrics('storage', percents))
+        if self.args.forecast:
+            with self.timer.span('forecast'):
+                days_to_full = StorageTrend(self.args.cluster_vip, self.args.forecast_samples,
+                                            self.args.forecast_interval).add(storage[0], storage[1], time.time())
+            if days_to_full is None:
+                _log.info("Cluster ip = {}: ".format(self.args.cluster_vip) +
+                          "Cluster storage is not growing or not sampled long enough for a forecast")
+            else:
+                _log.info("Cluster ip = {}: ".format(self.args.cluster_vip) +
+                          "Cluster storage is full in {0:.1f} days at its current growth".format(days_to_full))
+                metrics.append(nagiosplugin.Metric(
+                    "Days until storage full",
+                    round(days_to_full, 1),
+                    min=0,
+                    context='days_to_full'))
+        return self.metrics(metrics)
+
+
+def parse_args(argv=None):
+    argp = argument_parser()
     argp.add_argument('-w', '--warning', metavar='RANGE', default='~:60', help='return warning'
                                                                                ' if occupancy is outside RANGE')
     argp.add_argument('-c', '--critical', metavar='RANGE', default='~:80', help='return critical if'
                                                                                 ' occupancy is outside RANGE')
-    argp.add_argument('-v', '--verbose', action='count', default=0, help='increase output'
-                                                                         ' verbosity (use up to 3 times)')
-    argp.add_argument('-t', '--timeout', default=30,
-                      help='abort execution after TIMEOUT seconds')
-    return argp.parse_args()
-
-
-@nagiosplugin.guarded
-def main():
-    args = parse_args()
-    check = nagiosplugin.Check(
-        CohesityClusterStorage(args))
+    add_history_args(argp, STORAGE_METRIC)
+    argp.add_argument('--forecast', action='store_true',
+                      help='keep a time series of the used storage and forecast the days until it is full')
+    argp.add_argument('--days_warning', metavar='RANGE', default='30:', help='return warning if the days'
+                                                                             ' until full are outside RANGE')
+    argp.add_argument('--days_critical', metavar='RANGE', default='7:', help='return critical if the days'
+                                                                             ' until full are outside RANGE')
+    argp.add_argument('--forecast_samples', type=int, default=DEFAULT_SLOTS,
+                      help='number of used storage samples the forecast is fitted to')
+    argp.add_argument('--forecast_interval', type=int, default=DEFAULT_SAMPLE_INTERVAL,
+                      help='seconds between two used storage samples')
+    argp.add_argument('--cluster_cache_ttl', type=int, default=DEFAULT_CLUSTER_CACHE_TTL,
+                      help='seconds the cluster information is shared with the other storage checks,'
+                           ' 0 to always fetch it')
+    return parse_check_args(argp, argv)
+
+
+def build_check(args):
+    """
+    Method to build the nagios check
+    :param args: commandline arguments
+    :return: check(nagiosplugin.Check)
+    """
+    check = new_check(CohesityClusterStorage(args))
     check.add(
         nagiosplugin.ScalarContext(
             'cluster_used_storage',
             args.warning,
             args.critical))
-    check.main(args.verbose, args.timeout)
+    check.add(
+        nagiosplugin.ScalarContext(
+            'days_to_full',
+            args.days_warning,
+            args.days_critical))
+    add_history_contexts(check, args)
+    return check
+
+
+@nagiosplugin.guarded
+def main():
+    run('check_cohesity_storage', parse_args, build_check)
 
 
 if __name__ == '__main__':
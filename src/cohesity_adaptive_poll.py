@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# Copyright 2019 Cohesity Inc.
+# Author : Cohesity Developer <cohesity-api-sdks@cohesity.com>
+# This module decides when a check has to call the cluster again and serves the last result in between.
+# Nagios runs every check at a fixed interval, but most metrics, like the used storage, move slowly.
+# The interval of a check is adapted to its metrics after every call of the cluster:
+#  - a metric moving towards one of its warning or critical bounds must not cross it before the next call,
+#    the interval is a fraction of the time the metric needs to reach the bound at its current rate
+#  - when no metric changes the interval is doubled, up to the longest interval
+#  - a metric close to one of its bounds keeps the shortest interval, even when it does not change
+#  - a new check, a changed status or an UNKNOWN result go back to the shortest interval
+# The metrics and their bounds are read from the performance data of the nagios output, the timings of
+# the checks (see cohesity_timing.py) and the age of a cached result (see cohesity_result_cache.py) are not
+# metrics of the cluster and are ignored.
+# The check daemon keeps the intervals in memory, cohesity_multi_cluster.py and cohesity_passive_checks.py
+# keep them in a state file between runs.
+#
+
+import json
+import math
+import os
+import re
+import threading
+import time
+
+from cohesity_defaults import STATE_DIR, UNKNOWN
+from cohesity_result_cache import RESULT_AGE_LABEL
+from cohesity_timing import TIMING_PREFIX
+
+DEFAULT_POLL_STATE = os.path.join(STATE_DIR, 'adaptive_poll.json')
+# Shortest and longest interval between two calls of the cluster by a check, in seconds.
+MIN_INTERVAL = 60
+MAX_INTERVAL = 1800
+# Fraction of the time a metric needs to reach a bound that may pass before the next call.
+MARGIN = 0.5
+# Distance to a bound, as a fraction of the bound, below which a metric is close to the bound.
+NEAR_BOUND = 0.05
+
+PERFDATA = re.compile(r"('[^']+'|[^\s'=]+)=(-?[\d.]+)[^;\s]*(?:;([^;\s]*))?(?:;([^;\s]*))?")
+
+
+def performance_data(output):
+    """
+    Method to read the metrics of a nagios output
+    :param output(str): nagios output of a check
+    :return: metrics(dict): label to list of value and the finite bounds of its warning and critical ranges
+    """
+    from nagiosplugin import Range
+
+    metrics = {}
+    for line in output.splitlines():
+        if '|' not in line:
+            continue
+        for match in PERFDATA.finditer(line.split('|', 1)[1]):
+            label, value, warning, critical = match.groups()
+            if label.strip("'").startswith(TIMING_PREFIX) or label.strip("'") == RESULT_AGE_LABEL:
+                continue
+            bounds = []
+            for spec in (warning, critical):
+                if not spec:
+                    continue
+                try:
+                    bounds_range = Range(spec)
+                except ValueError:
+                    continue
+                bounds.extend(bound for bound in (bounds_range.start, bounds_range.end) if not math.isinf(bound))
+            try:
+                metrics[label.strip("'")] = [float(value), bounds]
+            except ValueError:
+                continue
+    return metrics
+
+
+class AdaptivePoller(object):
+    def __init__(self, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL, margin=MARGIN, near_bound=NEAR_BOUND):
+        """
+        Method to initialize
+        :param min_interval(int): shortest interval between two calls of the cluster by a check
+        :param max_interval(int): longest interval between two calls of the cluster by a check
+        :param margin(float): fraction of the time a metric needs to reach a bound that may pass before the next call
+        :param near_bound(float): fraction of a bound below which a metric is close to it
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.margin = margin
+        self.near_bound = near_bound
+        self.entries = {}
+        self.polled = set()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(check_name, argv):
+        return json.dumps([check_name, list(argv)])
+
+    def poll(self, check_name, argv, run_check, now=None):
+        """
+        Method to get the result of a check, the check only runs when its interval has passed
+        :param check_name(str): name of the check script
+        :param argv(list): commandline arguments of the check
+        :param run_check(function): runs the check, called with the check name and arguments
+        :return: list(lst): of exit code and nagios output
+        """
+        key = self.key(check_name, argv)
+        now = now or time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            self.polled.add(key)
+        if entry and now < entry['fetched_at'] + entry['interval']:
+            return [entry['exitcode'], entry['output']]
+        exitcode, output = run_check(check_name, argv)
+        metrics = performance_data(output)
+        with self.lock:
+            self.entries[key] = {'fetched_at': now,
+                                 'interval': self.next_interval(entry, exitcode, metrics, now),
+                                 'exitcode': exitcode,
+                                 'output': output,
+                                 'metrics': metrics}
+            # The checks not polled for a long time are dropped, like in save.
+            for old_key in [k for k, e in self.entries.items() if now - e['fetched_at'] >= 2 * self.max_interval]:
+                del self.entries[old_key]
+                self.polled.discard(old_key)
+        return [exitcode, output]
+
+    def next_interval(self, entry, exitcode, metrics, now):
+        """
+        Method to compute the seconds until the next call of the cluster by a check
+        :param entry(dict): last result of the check, None for a new check
+        :param exitcode(int): status of the new result
+        :param metrics(dict): metrics of the new result
+        :return: interval(float)
+        """
+        if not entry or exitcode == UNKNOWN or exitcode != entry['exitcode'] or not metrics:
+            return self.min_interval
+        elapsed = max(now - entry['fetched_at'], 1)
+        interval = entry['interval'] * 2
+        for label, (value, bounds) in metrics.items():
+            if label not in entry['metrics']:
+                return self.min_interval
+            # Close to a bound the smallest change crosses it, whatever the metric did so far.
+            if any(abs(bound - value) <= self.near_bound * max(abs(bound), 1) for bound in bounds):
+                return self.min_interval
+            change = value - entry['metrics'][label][0]
+            if not change:
+                continue
+            # A changing metric keeps the interval from growing.
+            interval = min(interval, entry['interval'])
+            for bound in bounds:
+                if (bound - value) * change > 0:
+                    interval = min(interval, self.margin * elapsed * (bound - value) / change)
+        return max(self.min_interval, min(interval, self.max_interval))
+
+    def load(self, path=DEFAULT_POLL_STATE):
+        """
+        Method to read the intervals and last results of the checks from a state file
+        :param path(str): state file
+        """
+        from cohesity_token_cache import state_file
+
+        with state_file(path, commit=False) as cookie:
+            entries = cookie.get('entries', {})
+        with self.lock:
+            self.entries.update(entries)
+
+    def save(self, path=DEFAULT_POLL_STATE):
+        """
+        Method to write the intervals and last results of the checks polled by this process to a state file,
+        the checks of other processes are kept and the ones not polled for a long time are dropped
+        :param path(str): state file
+        """
+        from cohesity_token_cache import state_file
+
+        now = time.time()
+        with state_file(path) as cookie:
+            entries = cookie.get('entries', {})
+            with self.lock:
+                entries.update((key, self.entries[key]) for key in self.polled if key in self.entries)
+            cookie['entries'] = dict((key, entry) for key, entry in entries.items()
+                                     if now - entry['fetched_at'] < 2 * self.max_interval)
+
+
+def add_poll_args(argp):
+    """
+    Method to add the commandline arguments of the adaptive polling
+    :param argp(ArgumentParser): parser of the script
+    """
+    argp.add_argument('--adaptive', action='store_true',
+                      help='only call the cluster when the interval of the check has passed, '
+                           'serve its last result in between')
+    argp.add_argument('--min_interval', type=int, default=MIN_INTERVAL,
+                      help='shortest interval between two calls of the cluster by a check, in seconds')
+    argp.add_argument('--max_interval', type=int, default=MAX_INTERVAL,
+                      help='longest interval between two calls of the cluster by a check, in seconds')
+
+
+def adaptive_poller(args):
+    """
+    Method to create the adaptive poller of the commandline arguments
+    :return: poller(AdaptivePoller): None without --adaptive
+    """
+    if not args.adaptive:
+        return None
+    return AdaptivePoller(args.min_interval, args.max_interval)
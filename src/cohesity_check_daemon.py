@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+# Copyright 2019 Cohesity Inc.
+# Author : Cohesity Developer <cohesity-api-sdks@cohesity.com>
+# This script runs the cohesity nagios checks in one long-lived process so that the
+# python interpreter, the check modules and the http session are loaded once instead of on every check.
+# The daemon listens on a local UNIX socket and runs each check in its own thread, so a slow cluster does
+# not hold the checks of the other clusters. The checks are asked
+# for either with the --daemon_socket argument of each script or with the query command below,
+# which only loads the python standard library.
+# If the daemon is not running, the scripts run the check themselves.
+# With --adaptive the daemon only calls the cluster when the interval of the check has passed and answers
+# with the last result in between (see cohesity_adaptive_poll.py).
+#
+# Usage :
+# python cohesity_check_daemon.py serve --socket /abc/def/cohesity_checks.sock
+# python cohesity_check_daemon.py serve --socket /abc/def/cohesity_checks.sock --adaptive --max_interval 3600
+# python cohesity_check_daemon.py query --socket /abc/def/cohesity_checks.sock check_cohesity_alerts
+#                                 --cluster_vip 10.10.99.100 --host_name PaulCluster --auth_file /abc/def/config.ini
+#
+
+import argparse
+import importlib
+import io
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from cohesity_adaptive_poll import adaptive_poller, add_poll_args
+from cohesity_defaults import STATE_DIR, UNKNOWN, make_state_dir
+
+_log = logging.getLogger('nagiosplugin')
+
+DEFAULT_SOCKET = os.path.join(STATE_DIR, 'checks.sock')
+CHECKS = ('check_cohesity_alerts',
+          'check_cohesity_cluster_health',
+          'check_cohesity_metastorage',
+          'check_cohesity_node_status',
+          'check_cohesity_objects_unprotected',
+          'check_cohesity_protection_runs',
+          'check_cohesity_storage')
+# Path arguments of the checks, the daemon runs in another working directory than the caller.
+PATH_OPTIONS = ('-f', '--auth_file', '--auth_key_file', '--token_cache', '--timing_trace', '--result_cache_file')
+
+
+def absolute_paths(argv):
+    """
+    Method to make the relative paths of the commandline arguments of a check absolute
+    :param argv(list): commandline arguments of the check
+    :return: argv(lst)
+    """
+    argv = list(argv)
+    for index, arg in enumerate(argv):
+        name, separator, value = arg.partition('=')
+        if name not in PATH_OPTIONS:
+            continue
+        if separator:
+            argv[index] = name + separator + os.path.abspath(value)
+        elif index + 1 < len(argv):
+            argv[index + 1] = os.path.abspath(argv[index + 1])
+    return argv
+
+
+def check_timeout(argv):
+    """
+    Method to read the timeout of a check from its commandline arguments
+    :param argv(list): commandline arguments of the check
+    :return: timeout(int): seconds, 30 if it is not given
+    """
+    argp = argparse.ArgumentParser(add_help=False)
+    argp.add_argument('-t', '--timeout', type=int, default=30)
+    return argp.parse_known_args(argv)[0].timeout
+
+
+def query_daemon(socket_path, check_name, argv, timeout=30):
+    """
+    Method to run a check in the daemon, prints the nagios output and exits with the check status.
+    Returns without output if the daemon can not be reached.
+    :param socket_path(str): UNIX socket of the daemon
+    :param check_name(str): name of the check script
+    :param argv(list): commandline arguments of the check
+    :param timeout(int): seconds to wait for the check result
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Give the daemon time to report its own timeout of the check.
+    client.settimeout(int(timeout) + 5)
+    try:
+        client.connect(socket_path)
+    except socket.error:
+        client.close()
+        return
+    try:
+        request = json.dumps({'check': check_name, 'argv': absolute_paths(argv)}) + '\n'
+        client.sendall(request.encode('utf-8'))
+        response = client.makefile('rb').readline()
+    except socket.error as e:
+        sys.stdout.write('UNKNOWN: no result of {0} from the cohesity check daemon: {1}\n'.format(check_name, e))
+        sys.exit(UNKNOWN)
+    finally:
+        client.close()
+    result = json.loads(response.decode('utf-8'))
+    sys.stdout.write(result['output'])
+    sys.stdout.flush()
+    sys.exit(result['exitcode'])
+
+
+class ThreadFilter(logging.Filter):
+    def __init__(self):
+        """
+        Method to initialize, only the log records of the current thread pass the filter
+        """
+        logging.Filter.__init__(self)
+        self.thread = threading.current_thread().ident
+
+    def filter(self, record):
+        return record.thread == self.thread
+
+
+def run_check(check_name, argv, use_alarm=True):
+    """
+    Method to run a check in this process. A process running many checks keeps the log messages of the checks
+    out of the handlers of the root logger, see serve.
+    :param check_name(str): name of the check script
+    :param argv(list): commandline arguments of the check
+    :param use_alarm(bool): abort the check with SIGALRM after its timeout, only possible in the main thread.
+    Without it the check sends no request to the cluster after its timeout.
+    :return: list(lst): of exit code and nagios output
+    """
+    import nagiosplugin
+    from nagiosplugin.output import Output
+    from nagiosplugin.platform import with_timeout
+
+    if check_name not in CHECKS:
+        return [UNKNOWN, 'UNKNOWN: unknown check {0}\n'.format(check_name)]
+    try:
+        args = importlib.import_module(check_name).parse_args(argv)
+    except SystemExit:
+        return [UNKNOWN, 'UNKNOWN: invalid arguments for {0}: {1}\n'.format(check_name, ' '.join(argv))]
+    if not use_alarm:
+        # A check nobody waits for anymore stops calling the cluster.
+        args.deadline = time.time() + int(args.timeout)
+
+    # Same log handling as nagiosplugin.Runtime, with a fresh log channel for every check.
+    logchan = logging.StreamHandler(io.StringIO())
+    logchan.setFormatter(logging.Formatter('%(message)s'))
+    # Checks may run in several threads at once, each one only reports its own log messages.
+    logchan.addFilter(ThreadFilter())
+    verbose = min(int(args.verbose), 3)
+    if verbose >= 3:
+        logchan.setLevel(logging.DEBUG)
+    elif verbose == 2:
+        logchan.setLevel(logging.INFO)
+    else:
+        logchan.setLevel(logging.WARNING)
+    _log.setLevel(logging.DEBUG)
+    _log.addHandler(logchan)
+    output = Output(logchan, verbose)
+    check = None
+    try:
+        check = importlib.import_module(check_name).build_check(args)
+        if use_alarm:
+            with_timeout(int(args.timeout), check)
+        else:
+            check()
+        output.add(check)
+        exitcode = check.exitcode
+    except nagiosplugin.Timeout as e:
+        exitcode = UNKNOWN
+        output.status = '{0}UNKNOWN: Timeout: check execution aborted after {1}'.format(
+            check.name.upper() + ' ' if check else '', e)
+    except Exception:
+        exitcode = UNKNOWN
+        exc_type, value = sys.exc_info()[0:2]
+        output.status = '{0}UNKNOWN: {1}'.format(
+            check.name.upper() + ' ' if check else '',
+            traceback.format_exception_only(exc_type, value)[0].strip())
+        if verbose > 0:
+            output.add_longoutput(traceback.format_exc())
+    finally:
+        _log.removeHandler(logchan)
+    return [exitcode, str(output)]
+
+
+class CheckRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        """
+        Method to answer one check request, in its own thread
+        """
+        def run_thread_check(check_name, argv):
+            # SIGALRM only reaches the main thread, the check is bounded by the timeout of its requests.
+            return run_check(check_name, argv, use_alarm=False)
+
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+            if self.server.poller:
+                exitcode, output = self.server.poller.poll(request['check'], request['argv'], run_thread_check)
+            else:
+                exitcode, output = run_thread_check(request['check'], request['argv'])
+        except (ValueError, KeyError) as e:
+            exitcode, output = UNKNOWN, 'UNKNOWN: invalid daemon request: {0}\n'.format(e)
+        response = json.dumps({'exitcode': exitcode, 'output': output}) + '\n'
+        self.wfile.write(response.encode('utf-8'))
+
+
+def serve(socket_path, poller=None):
+    """
+    Method to serve check requests until the daemon is terminated
+    :param socket_path(str): UNIX socket to listen on
+    :param poller(AdaptivePoller): answers the checks between two calls of the cluster, None to always call it
+    """
+    # The check scripts are next to this script.
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    for check_name in CHECKS:
+        importlib.import_module(check_name)
+
+    make_state_dir(os.path.dirname(socket_path))
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    old_umask = os.umask(0o077)
+    try:
+        server = socketserver.ThreadingUnixStreamServer(socket_path, CheckRequestHandler)
+    finally:
+        os.umask(old_umask)
+    server.daemon_threads = True
+    server.poller = poller
+    # The check output is returned to the caller, keep it out of a stdout log handler of the root logger.
+    _log.propagate = False
+
+    def terminate(signum, frame):
+        raise KeyboardInterrupt()
+
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+
+
+def parse_args():
+    argp = argparse.ArgumentParser()
+    commands = argp.add_subparsers(dest='command')
+    serve_command = commands.add_parser('serve', help='run the check daemon')
+    serve_command.add_argument('-s', '--socket', default=DEFAULT_SOCKET,
+                               help='UNIX socket the daemon listens on')
+    add_poll_args(serve_command)
+    query_command = commands.add_parser('query', help='run a check in the check daemon')
+    query_command.add_argument('-s', '--socket', default=DEFAULT_SOCKET,
+                               help='UNIX socket the daemon listens on')
+    query_command.add_argument('check', choices=CHECKS,
+                               help='Check script to run')
+    query_command.add_argument('check_args', nargs=argparse.REMAINDER,
+                               help='commandline arguments of the check script')
+    return argp.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == 'serve':
+        serve(args.socket, adaptive_poller(args))
+    elif args.command == 'query':
+        query_daemon(args.socket, args.check, args.check_args, check_timeout(args.check_args))
+        sys.stdout.write('UNKNOWN: cohesity check daemon is not running on {0}\n'.format(args.socket))
+        sys.exit(UNKNOWN)
+    else:
+        sys.stdout.write('UNKNOWN: missing command, use serve or query\n')
+        sys.exit(UNKNOWN)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# Copyright 2019 Cohesity Inc.
+# Author : Cohesity Developer <cohesity-api-sdks@cohesity.com>
+# This module is the runtime the check scripts are plugins of. It owns what every check does the same way:
+# the common commandline arguments, the credentials of the auth file, the login and the REST
+# client of the cluster with its token cache and timeout, the timing of the run, the timing metrics and
+# contexts, and running the check here, in the check daemon or from its cached result.
+# A check script only defines its nagiosplugin Resource, derived from CohesityCheck, its own arguments
+# and contexts, in parse_args(argv) and build_check(args), and calls run() from its main().
+#
+
+import argparse
+import sys
+
+import nagiosplugin
+
+from cohesity_check_daemon import query_daemon, run_check
+from cohesity_credentials import credential_store
+from cohesity_result_cache import ResultCache, add_result_cache_args
+from cohesity_timing import TIMING_CONTEXT, Timer, add_timing_args, timing_metrics
+from cohesity_token_cache import CachedLogin, DEFAULT_TOKEN_CACHE, TokenCache
+
+DEFAULT_TIMEOUT = 30
+
+
+def read_credentials(auth_file, host_name, key_file=None):
+    """
+    Method to read the credentials of a cluster from the auth file, parsed once by the checks of this process
+    :param auth_file(str): .ini file with a section per host name
+    :param host_name(str): host name configured in Nagios
+    :param key_file(str): key of the encrypted auth file, None if it is not encrypted
+    :return: list(lst): of username, password and domain
+    """
+    return credential_store(auth_file, key_file).get(host_name)
+
+
+def cluster_login(args, timer=None):
+    """
+    Method to get the login of the cluster of a check
+    :param args: commandline arguments
+    :param timer(Timer): timer of the check
+    :return: login(CachedLogin)
+    """
+    username, password, domain = read_credentials(args.auth_file, args.host_name, args.auth_key_file)
+    return CachedLogin(TokenCache(args.token_cache),
+                       cluster_vip=args.cluster_vip,
+                       host_name=args.host_name,
+                       username=username,
+                       password=password,
+                       domain=domain,
+                       timer=timer)
+
+
+class CohesityCheck(nagiosplugin.Resource):
+    def __init__(self, args):
+        """
+        Method to initialize, logs in to the cluster of the check, or shares the timer, the login and the
+        REST client of the check in args.connection, like the checks of check_cohesity_cluster_health.py
+        :param args: commandline arguments
+        """
+        self.args = args
+        connection = getattr(args, 'connection', None)
+        if connection is not None:
+            self.timer = connection.timer
+            self.login = connection.login
+            self.cohesity_client = connection.cohesity_client
+            return
+        self.timer = Timer()
+        with self.timer.span('client'):
+            self.login = cluster_login(args, self.timer)
+            self.cohesity_client = self.login.rest_client(int(args.timeout), getattr(args, 'deadline', None))
+
+    def metrics(self, metrics):
+        """
+        Method to end the probe of the check
+        :param metrics(list): of nagiosplugin.Metric of the check
+        :return: list(lst): of the metrics and the timing metrics
+        """
+        return list(metrics) + timing_metrics(self.timer, self.args, self.name)
+
+
+def argument_parser():
+    """
+    Method to get the parser of the commandline arguments of a check, with the cluster arguments
+    :return: argp(ArgumentParser)
+    """
+    argp = argparse.ArgumentParser()
+    argp.add_argument('-ip', '--cluster_vip', required=True,
+                      help='Cohesity cluster ip or FQDN')
+    argp.add_argument('-n', '--host_name', required=True,
+                      help='Host name configured in Nagios')
+    argp.add_argument('-f', '--auth_file', required=True,
+                      help='.ini file path with Cohesity cluster credentials')
+    argp.add_argument('--auth_key_file',
+                      help='key file of the auth file, if it is encrypted')
+    return argp
+
+
+def parse_check_args(argp, argv=None):
+    """
+    Method to add the runtime arguments, after the arguments of the check, and parse the commandline
+    :param argp(ArgumentParser): parser of the check
+    :param argv(list): arguments, the commandline if None
+    :return: args: commandline arguments
+    """
+    argp.add_argument('--token_cache', default=DEFAULT_TOKEN_CACHE,
+                      help='state file used to cache the cluster access tokens')
+    add_timing_args(argp)
+    add_result_cache_args(argp)
+    argp.add_argument('--daemon_socket',
+                      help='run the check in the cohesity check daemon listening on this socket')
+    argp.add_argument('-v', '--verbose', action='count', default=0, help='increase output verbosity'
+                                                                         ' (use up to 3 times)')
+    argp.add_argument('-t', '--timeout', default=DEFAULT_TIMEOUT,
+                      help='abort execution after TIMEOUT seconds')
+    return argp.parse_args(argv)
+
+
+def new_check(resource):
+    """
+    Method to build the nagios check of a resource, with the runtime contexts
+    :param resource(CohesityCheck): resource of the check
+    :return: check(nagiosplugin.Check)
+    """
+    check = nagiosplugin.Check(resource)
+    check.add(nagiosplugin.ScalarContext(TIMING_CONTEXT))
+    return check
+
+
+def run(check_name, parse_args, build_check):
+    """
+    Method to run a check from its script, in the check daemon with --daemon_socket, from its cached
+    result with --result_cache
+    :param check_name(str): module name of the check
+    :param parse_args: parse_args(argv) of the check
+    :param build_check: build_check(args) of the check
+    """
+    args = parse_args()
+    if args.result_cache:
+        exitcode, output = ResultCache(args.result_cache_file, args.result_max_age).result(
+            check_name, sys.argv[1:], run_check)
+        sys.stdout.write(output)
+        sys.exit(exitcode)
+    if args.daemon_socket:
+        query_daemon(args.daemon_socket, check_name, sys.argv[1:], args.timeout)
+    check = build_check(args)
+    check.main(args.verbose, args.timeout)
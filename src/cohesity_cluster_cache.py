@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# Copyright 2019 Cohesity Inc.
+# Author : Cohesity Developer <cohesity-api-sdks@cohesity.com>
+# This module keeps a short lived snapshot of the cluster information (GET /public/cluster with stats)
+# so that check_cohesity_storage.py and check_cohesity_metastorage.py share one cluster fetch per poll cycle.
+# The snapshot is kept per cluster vip in a locked state file. The lock is held while the cluster is
+# fetched, so checks started at the same time wait for one fetch instead of doing their own.
+# RegistrationStatsCache keeps the protected and unprotected object counts of each environment of the
+# registered protection sources the same way for check_cohesity_objects_unprotected.py.
+# SharedClusterSnapshot gives the checks run together by check_cohesity_cluster_health.py one cluster fetch.
+#
+
+import logging
+import os
+import threading
+import time
+
+from cohesity_management_sdk.models.cluster import Cluster
+from cohesity_token_cache import STATE_DIR, state_file
+
+_log = logging.getLogger('nagiosplugin')
+
+DEFAULT_CLUSTER_CACHE_TTL = 60
+DEFAULT_REGISTRATION_CACHE_TTL = 0
+
+
+class ClusterSnapshotCache(object):
+    def __init__(self, ttl=DEFAULT_CLUSTER_CACHE_TTL, state_dir=STATE_DIR):
+        """
+        Method to initialize
+        :param ttl(int): seconds a snapshot is used, 0 disables the cache
+        :param state_dir(str): directory of the snapshot files
+        """
+        self.ttl = int(ttl)
+        self.state_dir = state_dir
+
+    def path(self, cluster_vip):
+        return os.path.join(self.state_dir, 'cluster_' + cluster_vip.replace(os.sep, '_') + '.json')
+
+    def get_cluster(self, login, client):
+        """
+        Method to get the cluster information with stats
+        :param login(CachedLogin): login of the cluster
+        :param client(RestClient): REST client of the cluster
+        :return: cluster_info(Cluster)
+        """
+        if self.ttl <= 0:
+            return login.call(client.get_cluster, fetch_stats=True)
+        # Includes the wait for the lock while another check fetches the cluster.
+        with login.timer.span('cluster_cache'):
+            # The snapshot file is only written when it is refreshed.
+            with state_file(self.path(login.cluster_vip), commit=False) as cookie:
+                if cookie.get('fetched_at', 0) + self.ttl > time.time():
+                    _log.debug("Cluster ip = {}: using cluster snapshot from {:.0f} seconds ago".format(
+                        login.cluster_vip, time.time() - cookie['fetched_at']))
+                else:
+                    cookie['cluster'] = login.call(client.get_json, '/public/cluster', fetch_stats=True)
+                    cookie['fetched_at'] = time.time()
+                    cookie.commit()
+                cluster = cookie['cluster']
+        with login.timer.span('models'):
+            return Cluster.from_dictionary(cluster)
+
+
+class SharedClusterSnapshot(object):
+    def __init__(self, cache):
+        """
+        Method to initialize
+        :param cache(ClusterSnapshotCache): cache the cluster information is read from once
+        """
+        self.cache = cache
+        self.cluster = None
+        self.lock = threading.Lock()
+
+    def get_cluster(self, login, client):
+        """
+        Method to get the cluster information with stats, fetched by the first caller
+        :return: cluster_info(Cluster)
+        """
+        # Includes the wait for the lock while another check fetches the cluster.
+        with login.timer.span('cluster_cache'):
+            with self.lock:
+                if self.cluster is None:
+                    self.cluster = self.cache.get_cluster(login, client)
+                return self.cluster
+
+
+class RegistrationStatsCache(object):
+    def __init__(self, ttl=DEFAULT_REGISTRATION_CACHE_TTL, lean=False, state_dir=STATE_DIR):
+        """
+        Method to initialize
+        :param ttl(int): seconds a snapshot is used, 0 disables the cache
+        :param lean(bool): do not ask for the entity permissions and only decode the stats of the environments
+        :param state_dir(str): directory of the snapshot files
+        """
+        self.ttl = int(ttl)
+        self.lean = lean
+        self.state_dir = state_dir
+
+    def path(self, cluster_vip):
+        return os.path.join(self.state_dir, 'registration_' + cluster_vip.replace(os.sep, '_') + '.json')
+
+    def fetch(self, login, client):
+        """
+        Method to get the stats of the environments from the registration info of the protection sources
+        :return: list(lst): of the stats of each environment, as in the json response
+        """
+        if self.lean:
+            # The registered sources come before the stats, they are decoded and dropped one at a time.
+            return list(login.call(client.iter_json, '/public/protectionSources/registrationInfo', key='statsByEnv'))
+        registration_info = login.call(client.get_json, '/public/protectionSources/registrationInfo',
+                                       include_entity_permission_info=True)
+        return registration_info.get('statsByEnv') or []
+
+    def get_stats_by_env(self, login, client):
+        """
+        Method to get the protected and unprotected object counts of each environment
+        :param login(CachedLogin): login of the cluster
+        :param client(RestClient): REST client of the cluster
+        :return: list(lst): of the stats of each environment, as in the json response
+        """
+        if self.ttl <= 0:
+            return self.fetch(login, client)
+        with login.timer.span('registration_cache'):
+            # The snapshot file is only written when it is refreshed.
+            with state_file(self.path(login.cluster_vip), commit=False) as cookie:
+                if cookie.get('fetched_at', 0) + self.ttl > time.time() and cookie.get('lean') == self.lean:
+                    _log.debug("Cluster ip = {}: using registration snapshot from {:.0f} seconds ago".format(
+                        login.cluster_vip, time.time() - cookie['fetched_at']))
+                else:
+                    cookie['stats_by_env'] = self.fetch(login, client)
+                    cookie['lean'] = self.lean
+                    cookie['fetched_at'] = time.time()
+                    cookie.commit()
+                return cookie['stats_by_env']
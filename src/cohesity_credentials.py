@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# Copyright 2019 Cohesity Inc.
+# Author : Cohesity Developer <cohesity-api-sdks@cohesity.com>
+# This module keeps the credentials of the auth file in memory, indexed by host name, so the check daemon
+# and the multi cluster runs parse a large auth file once instead of once per check. The file is parsed
+# again only when its modification time or size changes.
+# The auth file may be encrypted with a key file (--auth_key_file), it is then only decrypted in memory.
+# A section may also name a keyring service instead of a password, the password is then read from the
+# keyring of the user running the checks, once per load of the auth file.
+# Both need optional packages: cryptography for the encrypted auth file and keyring for the keyring.
+#
+# Usage :
+# python cohesity_credentials.py genkey /abc/def/config.key
+# python cohesity_credentials.py encrypt --key_file /abc/def/config.key /abc/def/config.ini /abc/def/config.ini.enc
+#
+
+import argparse
+import configparser
+import os
+import threading
+
+import nagiosplugin
+
+
+class CredentialStore(object):
+    def __init__(self, auth_file, key_file=None):
+        """
+        Method to initialize, the auth file is read with the first credentials
+        :param auth_file(str): .ini file with a section per host name
+        :param key_file(str): key of the encrypted auth file, None if it is not encrypted
+        """
+        self.auth_file = auth_file
+        self.key_file = key_file
+        self.version = None
+        self.sections = {}
+        self.lock = threading.Lock()
+
+    def file_version(self):
+        """
+        Method to get the version of the auth file
+        :return: version(tuple): modification time and size, None if there is no such file
+        """
+        try:
+            stat = os.stat(self.auth_file)
+        except OSError:
+            return None
+        return (stat.st_mtime, stat.st_size)
+
+    def read(self):
+        """
+        Method to parse the auth file
+        :return: sections(dict): of the options of each host name
+        """
+        parser = configparser.ConfigParser()
+        if self.key_file:
+            parser.read_string(decrypt_file(self.auth_file, self.key_file))
+        else:
+            parser.read(self.auth_file)
+        return dict((host_name, dict(parser.items(host_name))) for host_name in parser.sections())
+
+    def load(self):
+        """
+        Method to get the sections of the auth file, read again when the file changed
+        :return: sections(dict): of the options of each host name
+        """
+        with self.lock:
+            version = self.file_version()
+            if version is None or version != self.version:
+                self.sections = self.read() if version is not None else {}
+                self.version = version
+            return self.sections
+
+    def host_names(self):
+        """
+        Method to get the host names of the auth file
+        :return: list(lst): of the host names, in the order of the file
+        """
+        return list(self.load())
+
+    def section(self, host_name):
+        """
+        Method to get the options of a host name
+        :return: options(dict)
+        """
+        sections = self.load()
+        if host_name not in sections:
+            raise configparser.NoSectionError(host_name)
+        return sections[host_name]
+
+    def get(self, host_name):
+        """
+        Method to get the credentials of a cluster
+        :param host_name(str): host name configured in Nagios
+        :return: list(lst): of username, password and domain
+        """
+        options = self.section(host_name)
+        for option in ('username', 'domain'):
+            if option not in options:
+                raise configparser.NoOptionError(option, host_name)
+        if 'password' not in options:
+            if 'keyring' not in options:
+                raise configparser.NoOptionError('password', host_name)
+            with self.lock:
+                # The password read from the keyring is kept with the section, until the file changes.
+                if 'password' not in options:
+                    options['password'] = keyring_password(options['keyring'], options['username'])
+        return [options['username'], options['password'], options['domain']]
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def credential_store(auth_file, key_file=None):
+    """
+    Method to get the credential store of an auth file, shared by the checks of this process
+    :param auth_file(str): .ini file with a section per host name
+    :param key_file(str): key of the encrypted auth file, None if it is not encrypted
+    :return: store(CredentialStore)
+    """
+    key = (os.path.abspath(auth_file), key_file and os.path.abspath(key_file))
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = CredentialStore(auth_file, key_file)
+        return _stores[key]
+
+
+def fernet(key_file):
+    """
+    Method to get the cipher of a key file
+    :return: cipher(Fernet)
+    """
+    try:
+        from cryptography.fernet import Fernet
+    except ImportError:
+        raise nagiosplugin.CheckError('the cryptography package is needed for an encrypted auth file')
+    with open(key_file, 'rb') as key:
+        return Fernet(key.read().strip())
+
+
+def decrypt_file(auth_file, key_file):
+    """
+    Method to decrypt an auth file in memory
+    :return: text(str): of the .ini file
+    """
+    cipher = fernet(key_file)
+    from cryptography.fernet import InvalidToken
+
+    with open(auth_file, 'rb') as encrypted:
+        try:
+            return cipher.decrypt(encrypted.read().strip()).decode('utf-8')
+        except InvalidToken:
+            raise nagiosplugin.CheckError('cannot decrypt {0} with the key {1}'.format(auth_file, key_file))
+
+
+def keyring_password(service, username):
+    """
+    Method to read a password from the keyring of the user
+    :param service(str): keyring service of the password
+    :param username(str): user name of the password
+    :return: password(str)
+    """
+    try:
+        import keyring
+    except ImportError:
+        raise nagiosplugin.CheckError('the keyring package is needed for the keyring option of the auth file')
+    password = keyring.get_password(service, username)
+    if password is None:
+        raise nagiosplugin.CheckError('no password of {0} in the keyring service {1}'.format(username, service))
+    return password
+
+
+def write_private(path, data):
+    """
+    Method to write a file only readable by its owner
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as private:
+        private.write(data)
+
+
+def parse_args():
+    argp = argparse.ArgumentParser(description='Encrypt the auth file of the cohesity nagios checks')
+    commands = argp.add_subparsers(dest='command')
+    commands.required = True
+    genkey_command = commands.add_parser('genkey', help='write a new key file')
+    genkey_command.add_argument('key_file', help='key file to write')
+    encrypt_command = commands.add_parser('encrypt', help='encrypt an auth file')
+    encrypt_command.add_argument('--key_file', required=True, help='key file of the encryption')
+    encrypt_command.add_argument('auth_file', help='.ini file path with Cohesity cluster credentials')
+    encrypt_command.add_argument('encrypted_file', help='encrypted auth file to write')
+    return argp.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == 'genkey':
+        from cryptography.fernet import Fernet
+
+        write_private(args.key_file, Fernet.generate_key())
+    else:
+        with open(args.auth_file, 'rb') as auth_file:
+            write_private(args.encrypted_file, fernet(args.key_file).encrypt(auth_file.read()))
+
+
+if __name__ == '__main__':
+    main()
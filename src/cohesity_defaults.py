@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+# Copyright 2019 Cohesity Inc.
+# Author : Cohesity Developer <cohesity-api-sdks@cohesity.com>
+# This module holds the defaults shared by the cohesity nagios scripts: the directory of their state files,
+# created with make_state_dir, and the nagios UNKNOWN status. It only loads the python standard library, the query of the check daemon
+# and the result cache import it before anything else is loaded.
+#
+
+import os
+
+# Directory of the state files, like the token cache, the result cache and the socket of the check daemon.
+STATE_DIR = os.path.join(os.path.expanduser('~'), '.cohesity_nagios')
+# Exit code and status of the nagios UNKNOWN state
+UNKNOWN = 3
+
+
+def make_state_dir(directory):
+    """
+    Method to create a directory of state files readable only by its owner, if it does not exist
+    :param directory(str): path of the directory
+    """
+    if not directory or os.path.isdir(directory):
+        return
+    try:
+        os.makedirs(directory, 0o700)
+    except OSError:
+        # Another check started at the same time created it first.
+        if not os.path.isdir(directory):
+            raise
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# Copyright 2019 Cohesity Inc.
+# Author : Cohesity Developer <cohesity-api-sdks@cohesity.com>
+# This module decodes the records of a JSON array while the response is still being read, so a check can
+# process the records one at a time without holding the whole body and all its decoded records in memory.
+# The array is either the whole body or the value of a key of the top level object, like nodeStatus in the
+# cluster status. Each record is decoded with the json decoder of the standard library once it is complete.
+# A value is decoded again only when twice as much of it was read, so a large value costs a few decodes and not
+# one per chunk. The values of the other keys of the object are skipped, the records of an array one at a
+# time, so they are not kept.
+# A body that ends before the array is complete raises IncompleteJson after the records read so far.
+#
+
+import codecs
+import json
+
+from cohesity_timing import clock
+
+WHITESPACE = ' \t\n\r'
+
+
+class IncompleteJson(ValueError):
+    pass
+
+
+class JsonStream(object):
+    def __init__(self, chunks):
+        """
+        Method to initialize
+        :param chunks: iterable of the bytes of the body
+        """
+        self.chunks = iter(chunks)
+        self.text = codecs.getincrementaldecoder('utf-8')()
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.ended = False
+        # Seconds spent waiting for the chunks of the body.
+        self.read_secs = 0.0
+
+    def more(self, size=0):
+        """
+        Method to read the next chunk of the body, and the following ones until the buffer holds size characters
+        after the current position, the decoded part of the buffer is dropped
+        :param size(int): characters to read at least
+        :return: bool: False at the end of the body
+        """
+        if self.ended:
+            return False
+        texts = []
+        length = len(self.buffer) - self.pos
+        while not texts or length < size:
+            start = clock()
+            chunk = next(self.chunks, None)
+            self.read_secs = self.read_secs + clock() - start
+            if chunk is None:
+                self.ended = True
+                break
+            texts.append(self.text.decode(chunk))
+            length = length + len(texts[-1])
+        if not texts:
+            return False
+        self.buffer = self.buffer[self.pos:] + ''.join(texts)
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        Method to skip the whitespace
+        :return: char(str): next character, '' at the end of the body
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos = self.pos + 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.more():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise IncompleteJson('expected {0!r} at {1!r}'.format(char, self.buffer[self.pos:self.pos + 20]))
+        self.pos = self.pos + 1
+
+    def value(self):
+        """
+        Method to decode the next value, more of the body is read until the value is complete
+        :return: decoded value
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                # The value is decoded again once twice as much of it was read.
+                if not self.more(2 * (len(self.buffer) - self.pos)):
+                    raise IncompleteJson('body ends in a value at {0!r}'.format(self.buffer[self.pos:self.pos + 20]))
+                continue
+            # A number at the end of the buffer may go on in the next chunk.
+            if end == len(self.buffer) and self.more():
+                continue
+            self.pos = end
+            return value
+
+    def items(self):
+        """
+        Method to decode the records of the array at the current position, null is an empty array
+        :return: generator of the records
+        """
+        if self.peek() != '[':
+            if self.value() is not None:
+                raise IncompleteJson('expected an array')
+            return
+        self.pos = self.pos + 1
+        while True:
+            char = self.peek()
+            if char == ']':
+                self.pos = self.pos + 1
+                return
+            if char == ',':
+                self.pos = self.pos + 1
+                continue
+            if not char:
+                raise IncompleteJson('body ends in an array')
+            yield self.value()
+
+    def find_key(self, key):
+        """
+        Method to move to the value of a key of the top level object
+        :return: bool: False if the object has no such key
+        """
+        self.expect('{')
+        while True:
+            char = self.peek()
+            if char == '}':
+                return False
+            if char == ',':
+                self.pos = self.pos + 1
+                continue
+            if not char:
+                raise IncompleteJson('body ends in an object')
+            name = self.value()
+            self.expect(':')
+            if name == key:
+                return True
+            self.skip()
+
+    def skip(self):
+        """
+        Method to move after the next value, the records of an array are decoded and dropped one at a time
+        """
+        if self.peek() == '[':
+            for record in self.items():
+                pass
+        else:
+            self.value()
+
+    def records(self, key=None):
+        """
+        Method to decode the records of a JSON array one at a time
+        :param key(str): key of the array in the top level object, None if the body is the array
+        :return: generator of the records
+        """
+        if key is not None and not self.find_key(key):
+            return
+        for record in self.items():
+            yield record
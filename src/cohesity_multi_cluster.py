@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# Copyright 2019 Cohesity Inc.
+# Author : Cohesity Developer <cohesity-api-sdks@cohesity.com>
+# This script runs one of the cohesity nagios checks against many clusters at the same time.
+# The clusters are the sections of the .ini auth file, or the ones passed with --clusters.
+# Each cluster is checked in a bounded number of worker threads with its own timeout, counted from the start
+# of its check. The threads share the HTTP session of this process, which keeps a pool of keep-alive
+# connections per cluster.
+# The results are printed as one combined report, or written as nagios passive check results
+# to the nagios command file.
+# With --adaptive a cluster is only called when the interval of its check has passed, its last result is
+# reported in between (see cohesity_adaptive_poll.py).
+#
+# The cluster vip of an .ini section is read from its cluster_vip key, the section name is used if it is missing
+# [Cluster1HostName]
+# cluster_vip=10.10.99.100
+# username=abc
+# password=asdf
+# domain=LOCAL
+#
+# Usage :
+# python cohesity_multi_cluster.py --auth_file /abc/def/config.ini --workers 16 check_cohesity_storage -w 60 -c 90
+# python cohesity_multi_cluster.py --auth_file /abc/def/config.ini
+#                                  --clusters PaulCluster=10.10.99.100 AdamCluster=10.10.99.200
+#                                  --passive /usr/local/nagios/var/rw/nagios.cmd --service_description ALERTS
+#                                  check_cohesity_alerts --alert Disk
+#
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from cohesity_adaptive_poll import adaptive_poller, add_poll_args
+from cohesity_check_daemon import CHECKS, run_check
+from cohesity_credentials import credential_store
+from cohesity_defaults import UNKNOWN
+
+STATUS = ('OK', 'WARNING', 'CRITICAL', 'UNKNOWN')
+# POSIX guarantees that pipe writes of up to 512 bytes are not interleaved with other writers
+PIPE_BUF = 512
+
+
+def get_clusters(auth_file, clusters=None, key_file=None):
+    """
+    Method to get the clusters to check
+    :param auth_file(str): .ini file path with Cohesity cluster credentials
+    :param clusters(list): host_name=cluster_vip or host_name items, all the .ini sections if empty
+    :param key_file(str): key of the encrypted auth file, None if it is not encrypted
+    :return: list(lst): of host name and cluster vip pairs
+    """
+    if clusters:
+        return [cluster.split('=', 1) if '=' in cluster else [cluster, cluster] for cluster in clusters]
+    store = credential_store(auth_file, key_file)
+    return [[host_name, store.section(host_name).get('cluster_vip', host_name)]
+            for host_name in store.host_names()]
+
+
+def check_cluster(check_name, argv):
+    """
+    Method to run a check for one cluster in a worker thread, the timeout is enforced by run_checks
+    :return: list(lst): of exit code and nagios output
+    """
+    return run_check(check_name, argv, use_alarm=False)
+
+
+def run_checks(checks, workers, timeout, poller=None):
+    """
+    Method to run checks in parallel, each check is aborted when it runs longer than the timeout
+    :param checks(list): of key, check name and commandline arguments of each check
+    :param workers(int): number of checks run at the same time
+    :param timeout(int): seconds after which a check is aborted
+    :param poller(AdaptivePoller): answers the checks between two calls of the cluster, None to always call it
+    :return: list(lst): of key, exit code and nagios output for each check
+    """
+    # The log messages of the threads must not reach a stdout log handler of the root logger.
+    logging.getLogger('nagiosplugin').propagate = False
+    finished = queue.Queue()
+
+    def worker(index, check_name, argv):
+        if poller:
+            finished.put([index, poller.poll(check_name, argv, check_cluster)])
+        else:
+            finished.put([index, check_cluster(check_name, argv)])
+
+    results = [None] * len(checks)
+    # Deadline of each running check, its timeout starts when it gets a worker.
+    deadlines = {}
+    next_check = 0
+    while next_check < len(checks) or deadlines:
+        while next_check < len(checks) and len(deadlines) < (workers or 1):
+            key, check_name, argv = checks[next_check]
+            deadlines[next_check] = time.time() + timeout
+            thread = threading.Thread(target=worker, args=(next_check, check_name, argv))
+            # A thread still waiting for its cluster after the timeout is left behind, its worker is given to
+            # the next check and the thread ends with the process.
+            thread.daemon = True
+            thread.start()
+            next_check = next_check + 1
+        try:
+            index, result = finished.get(timeout=max(min(deadlines.values()) - time.time(), 0))
+        except queue.Empty:
+            now = time.time()
+            for index in [index for index, deadline in deadlines.items() if deadline <= now]:
+                del deadlines[index]
+                results[index] = [UNKNOWN, 'UNKNOWN: Timeout: check execution aborted after {0}s\n'.format(timeout)]
+            continue
+        if index in deadlines:
+            del deadlines[index]
+            results[index] = result
+    return [[checks[index][0]] + results[index] for index in range(len(checks))]
+
+
+def cluster_argv(check_args, host_name, cluster_vip, auth_file, timeout, key_file=None):
+    """
+    Method to get the commandline arguments of a check for one cluster
+    :return: argv(lst)
+    """
+    argv = list(check_args) + ['--cluster_vip', cluster_vip, '--host_name', host_name,
+                               '--auth_file', auth_file, '--timeout', str(timeout)]
+    if key_file:
+        argv.extend(['--auth_key_file', key_file])
+    return argv
+
+
+def check_clusters(check_name, clusters, auth_file, check_args, workers, timeout, poller=None, key_file=None):
+    """
+    Method to run a check against many clusters in parallel
+    :param check_name(str): name of the check script
+    :param clusters(list): of host name and cluster vip pairs
+    :param auth_file(str): .ini file path with Cohesity cluster credentials
+    :param check_args(list): extra commandline arguments of the check
+    :param workers(int): number of clusters checked at the same time
+    :param timeout(int): seconds after which the check of a cluster is aborted
+    :param poller(AdaptivePoller): answers the checks between two calls of the cluster, None to always call it
+    :param key_file(str): key of the encrypted auth file, None if it is not encrypted
+    :return: list(lst): of host name, exit code and nagios output for each cluster
+    """
+    return run_checks([[host_name, check_name,
+                        cluster_argv(check_args, host_name, cluster_vip, auth_file, timeout, key_file)]
+                       for host_name, cluster_vip in clusters], workers, timeout, poller)
+
+
+def passive_check_result(host_name, service_description, exitcode, output, timestamp=None):
+    """
+    Method to format a nagios passive service check result external command, the end of a long output is cut
+    so that the command is no larger than PIPE_BUF
+    :return: command(str)
+    """
+    command = '[{0}] PROCESS_SERVICE_CHECK_RESULT;{1};{2};{3};'.format(
+        int(timestamp or time.time()), host_name, service_description, exitcode)
+    output = output.rstrip('\n').replace('\n', '\\n')
+    room = PIPE_BUF - len((command + '\n').encode('utf-8'))
+    if len(output.encode('utf-8')) > room:
+        output = output.encode('utf-8')[:max(room, 0)].decode('utf-8', 'ignore')
+        if output.endswith('\\') and not output.endswith('\\\\'):
+            # Part of an escaped newline
+            output = output[:-1]
+    return command + output + '\n'
+
+
+def write_command_file(path, commands):
+    """
+    Method to write external commands to the nagios command file.
+    The command file is a pipe, the commands are written in blocks of whole lines no larger than PIPE_BUF
+    so that they are not mixed with the commands of other writers.
+    :param path(str): nagios command file
+    :param commands(list): of external commands, one line each no larger than PIPE_BUF
+    """
+    blocks = []
+    for command in commands:
+        command = command.encode('utf-8')
+        if blocks and len(blocks[-1]) + len(command) <= PIPE_BUF:
+            blocks[-1] = blocks[-1] + command
+        else:
+            blocks.append(command)
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o660)
+    try:
+        for block in blocks:
+            os.write(fd, block)
+    finally:
+        os.close(fd)
+
+
+def combined_report(check_name, results):
+    """
+    Method to format the results of all clusters as one nagios output
+    :return: list(lst): of exit code and nagios output
+    """
+    exitcode = max(result[1] for result in results) if results else UNKNOWN
+    counts = [len([result for result in results if result[1] == code]) for code in range(len(STATUS))]
+    summary = ', '.join('{0} {1}'.format(count, STATUS[code].lower()) for code, count in enumerate(counts) if count)
+    lines = ['{0} {1} - {2} clusters: {3}'.format(check_name.upper(), STATUS[exitcode], len(results), summary)]
+    for host_name, code, output in sorted(results, key=lambda result: -result[1]):
+        lines.append('{0}: {1}'.format(host_name, output.split('\n', 1)[0].split('|', 1)[0].strip()))
+    return [exitcode, '\n'.join(lines) + '\n']
+
+
+def parse_args():
+    argp = argparse.ArgumentParser()
+    argp.add_argument('-f', '--auth_file', required=True,
+                      help='.ini file path with Cohesity cluster credentials')
+    argp.add_argument('--auth_key_file',
+                      help='key file of the auth file, if it is encrypted')
+    argp.add_argument('--clusters', nargs='+',
+                      help='host_name=cluster_vip of the clusters to check, defaults to all the .ini sections')
+    argp.add_argument('--workers', type=int, default=8,
+                      help='number of clusters checked at the same time')
+    argp.add_argument('--passive', metavar='COMMAND_FILE',
+                      help='write the results as passive check results to the nagios command file')
+    argp.add_argument('--service_description',
+                      help='nagios service of the passive check results, defaults to the check name')
+    argp.add_argument('-t', '--timeout', type=int, default=30,
+                      help='abort the check of a cluster after TIMEOUT seconds')
+    add_poll_args(argp)
+    argp.add_argument('check', choices=CHECKS,
+                      help='Check script to run')
+    argp.add_argument('check_args', nargs=argparse.REMAINDER,
+                      help='commandline arguments of the check script')
+    return argp.parse_args()
+
+
+def main():
+    args = parse_args()
+    clusters = get_clusters(args.auth_file, args.clusters, args.auth_key_file)
+    poller = adaptive_poller(args)
+    if poller:
+        poller.load()
+    results = check_clusters(args.check, clusters, args.auth_file, args.check_args, args.workers, args.timeout,
+                             poller, args.auth_key_file)
+    if poller:
+        poller.save()
+    if args.passive:
+        service_description = args.service_description or args.check
+        now = time.time()
+        write_command_file(args.passive, [passive_check_result(host_name, service_description, exitcode, output, now)
+                                          for host_name, exitcode, output in results])
+    exitcode, output = combined_report(args.check, results)
+    sys.stdout.write(output)
+    sys.exit(exitcode)
+
+
+if __name__ == '__main__':
+    main()
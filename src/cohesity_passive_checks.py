@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# Copyright 2019 Cohesity Inc.
+# Author : Cohesity Developer <cohesity-api-sdks@cohesity.com>
+# This script runs several cohesity nagios checks against many clusters in one process and submits
+# all the results at once as nagios passive service check results, instead of nagios starting
+# one plugin process per check and cluster.
+# The results are written to the nagios external command file, or sent to an NRDP server.
+# Each service is given as SERVICE_DESCRIPTION=check name and arguments, the clusters are the sections of the
+# .ini auth file or the ones passed with --clusters (see cohesity_multi_cluster.py).
+# Run it from cron or as an active check of the nagios server, it prints a summary of the submitted results.
+# With --adaptive it can run often: a cluster is only called when the interval of the check has passed,
+# the last result is submitted again in between (see cohesity_adaptive_poll.py).
+#
+# Usage :
+# python cohesity_passive_checks.py --auth_file /abc/def/config.ini
+#                                   --service "ALERTS=check_cohesity_alerts --alert Disk Node"
+#                                             "STORAGE=check_cohesity_storage -w 60 -c 90"
+#                                   --command_file /usr/local/nagios/var/rw/nagios.cmd
+# python cohesity_passive_checks.py --auth_file /abc/def/config.ini --service NODES=check_cohesity_node_status
+#                                   --nrdp_url https://nagios.example.com/nrdp/ --nrdp_token abcdef
+#
+
+import argparse
+import json
+import shlex
+import sys
+import time
+
+from cohesity_adaptive_poll import adaptive_poller, add_poll_args
+from cohesity_check_daemon import CHECKS
+from cohesity_defaults import UNKNOWN
+from cohesity_multi_cluster import (STATUS, cluster_argv, get_clusters, passive_check_result, run_checks,
+                                    write_command_file)
+from cohesity_session import shared_session
+
+
+def service(value):
+    """
+    Method to parse a service given as SERVICE_DESCRIPTION=check name and arguments
+    :return: list(lst): of service description, check name and check arguments
+    """
+    try:
+        service_description, command = value.split('=', 1)
+        check_args = shlex.split(command)
+        check_name = check_args.pop(0)
+    except (ValueError, IndexError):
+        raise argparse.ArgumentTypeError('expected SERVICE_DESCRIPTION=CHECK [ARGS], got ' + value)
+    if check_name not in CHECKS:
+        raise argparse.ArgumentTypeError('unknown check {0}, use one of {1}'.format(check_name, ', '.join(CHECKS)))
+    return [service_description, check_name, check_args]
+
+
+def submit_nrdp(url, token, results, timeout, verify=True):
+    """
+    Method to send passive service check results to an NRDP server
+    :param results(list): of host name, service description, exit code and nagios output
+    :return: message(str): answer of the NRDP server
+    """
+    checkresults = [{'checkresult': {'type': 'service', 'checktype': '1'},
+                     'hostname': host_name,
+                     'servicename': service_description,
+                     'state': str(exitcode),
+                     'output': output.rstrip('\n')}
+                    for host_name, service_description, exitcode, output in results]
+    response = shared_session().post(url, data={'token': token,
+                                                'cmd': 'submitcheck',
+                                                'JSONDATA': json.dumps({'checkresults': checkresults})},
+                                     verify=verify, timeout=timeout)
+    if response.status_code != 200:
+        raise IOError('NRDP server answered with status {0}'.format(response.status_code))
+    try:
+        result = response.json()['result']
+    except (ValueError, KeyError, TypeError):
+        return response.text.strip()
+    if int(result.get('status', 0)) != 0:
+        raise IOError('NRDP server rejected the results: {0}'.format(result.get('message')))
+    return result.get('message', '')
+
+
+def parse_args():
+    argp = argparse.ArgumentParser()
+    argp.add_argument('-f', '--auth_file', required=True,
+                      help='.ini file path with Cohesity cluster credentials')
+    argp.add_argument('--auth_key_file',
+                      help='key file of the auth file, if it is encrypted')
+    argp.add_argument('--clusters', nargs='+',
+                      help='host_name=cluster_vip of the clusters to check, defaults to all the .ini sections')
+    argp.add_argument('-s', '--service', nargs='+', type=service, required=True,
+                      metavar='SERVICE_DESCRIPTION=CHECK [ARGS]',
+                      help='nagios service and the check that gives its result')
+    argp.add_argument('--workers', type=int, default=8,
+                      help='number of checks run at the same time')
+    argp.add_argument('--command_file',
+                      help='write the results to the nagios external command file')
+    argp.add_argument('--nrdp_url',
+                      help='send the results to this NRDP server')
+    argp.add_argument('--nrdp_token',
+                      help='token of the NRDP server')
+    argp.add_argument('--nrdp_insecure', action='store_true',
+                      help='do not verify the certificate of the NRDP server')
+    argp.add_argument('-t', '--timeout', type=int, default=30,
+                      help='abort a check after TIMEOUT seconds')
+    add_poll_args(argp)
+    args = argp.parse_args()
+    if not args.command_file and not args.nrdp_url:
+        argp.error('one of --command_file and --nrdp_url is required')
+    return args
+
+
+def main():
+    args = parse_args()
+    clusters = get_clusters(args.auth_file, args.clusters, args.auth_key_file)
+    checks = []
+    for service_description, check_name, check_args in args.service:
+        for host_name, cluster_vip in clusters:
+            checks.append([[host_name, service_description], check_name,
+                           cluster_argv(check_args, host_name, cluster_vip, args.auth_file, args.timeout,
+                                        args.auth_key_file)])
+    now = time.time()
+    poller = adaptive_poller(args)
+    if poller:
+        poller.load()
+    results = [[key[0], key[1], exitcode, output] for key, exitcode, output in
+               run_checks(checks, args.workers, args.timeout, poller)]
+    if poller:
+        poller.save()
+
+    errors = []
+    if args.command_file:
+        try:
+            write_command_file(args.command_file, [passive_check_result(host_name, service_description,
+                                                                        exitcode, output, now)
+                                                   for host_name, service_description, exitcode, output in results])
+        except (IOError, OSError) as e:
+            errors.append('command file {0}: {1}'.format(args.command_file, e))
+    if args.nrdp_url:
+        try:
+            submit_nrdp(args.nrdp_url, args.nrdp_token, results, args.timeout, verify=not args.nrdp_insecure)
+        except Exception as e:
+            errors.append('NRDP server {0}: {1}'.format(args.nrdp_url, e))
+
+    counts = [len([result for result in results if result[2] == code]) for code in range(len(STATUS))]
+    summary = ', '.join('{0} {1}'.format(count, STATUS[code].lower()) for code, count in enumerate(counts) if count)
+    if errors:
+        sys.stdout.write('COHESITY_PASSIVE_CHECKS UNKNOWN - submitting {0} results failed: {1}\n'.format(
+            len(results), '; '.join(errors)))
+        sys.exit(UNKNOWN)
+    sys.stdout.write('COHESITY_PASSIVE_CHECKS OK - submitted {0} results of {1} services on {2} clusters: {3}'
+                     ' | results={0};;;0 seconds={4:.3f}s;;;0\n'.format(
+                         len(results), len(args.service), len(clusters), summary or 'none', time.time() - now))
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# Copyright 2019 Cohesity Inc.
+# Author : Cohesity Developer <cohesity-api-sdks@cohesity.com>
+# This module is a thin client for the few Cohesity REST API calls used by the nagios scripts.
+# Loading the CohesityClient of the cohesity sdk imports all its controllers and most of its models,
+# which takes longer than the check itself. This client sends the same requests with the shared
+# HTTP session and returns the same sdk models, only the models that are used are imported.
+# Errors are raised as the APIException of the sdk.
+# Large responses can be read as a stream of records (see cohesity_json_stream.py).
+#
+
+import collections
+import time
+
+import nagiosplugin
+
+from cohesity_management_sdk.exceptions.api_exception import APIException
+from cohesity_json_stream import JsonStream
+from cohesity_session import shared_session
+from cohesity_timing import clock
+
+API_ROOT = '/irisservices/api/v1'
+# Bytes of a streamed response read at a time.
+STREAM_CHUNK_SIZE = 64 * 1024
+# Stand-in for the HttpContext of the sdk, APIException reads the status code from the response.
+RestContext = collections.namedtuple('RestContext', 'request response')
+
+
+def query_parameters(params):
+    """
+    Method to build the query parameters like the sdk: camelCase names, indexed lists and no empty values
+    :param params(dict): snake_case names and values
+    :return: list(lst): of name and value pairs
+    """
+    query = []
+    for name, value in sorted(params.items()):
+        if value is None:
+            continue
+        words = name.split('_')
+        name = words[0] + ''.join(word.capitalize() for word in words[1:])
+        if isinstance(value, (list, tuple)):
+            query.extend(('{0}[{1}]'.format(name, index), element)
+                         for index, element in enumerate([element for element in value if element]))
+        else:
+            query.append((name, str(value)))
+    return query
+
+
+class RestClient(object):
+    def __init__(self, login, timeout=60, deadline=None):
+        """
+        Method to initialize
+        :param login(CachedLogin): login of the cluster
+        :param timeout(int): seconds to wait for the cluster
+        :param deadline(float): time after which no request is sent, None for no limit
+        """
+        self.login = login
+        self.timeout = timeout
+        self.deadline = deadline
+
+    def request_timeout(self):
+        """
+        Method to get the timeout of the next request, raises nagiosplugin.Timeout after the deadline
+        :return: timeout(float): seconds to wait for the cluster
+        """
+        if self.deadline is None:
+            return self.timeout
+        remaining = self.deadline - time.time()
+        if remaining <= 0:
+            raise nagiosplugin.Timeout('{0}s'.format(self.timeout))
+        return min(self.timeout, remaining)
+
+    def get_json(self, path, **params):
+        """
+        Method to send a GET request to the cluster
+        :param path(str): path below /irisservices/api/v1
+        :param params: query parameters with snake_case names
+        :return: decoded json response
+        """
+        response = self.get(path, params)
+        with self.login.timer.span('decode', path=path):
+            return response.json()
+
+    def iter_json(self, path, key=None, **params):
+        """
+        Method to send a GET request to the cluster and decode the records of the response while it is read
+        :param path(str): path below /irisservices/api/v1
+        :param key(str): key of the array of records in the response object, None if the response is the array
+        :param params: query parameters with snake_case names
+        :return: generator of the decoded records, raises IncompleteJson if the response ends too early
+        """
+        return self.records(self.get(path, params, stream=True), path, key)
+
+    def get(self, path, params, stream=False):
+        """
+        Method to send a GET request to the cluster, raises APIException if the request fails
+        :param stream(bool): only read the headers of the response, the body is read by the caller
+        :return: response(requests.Response)
+        """
+        try:
+            headers = self.login.headers(timeout=self.request_timeout())
+            with self.login.timer.span('request', path=path) as span:
+                response = shared_session().get('https://' + self.login.cluster_vip + API_ROOT + path,
+                                                 params=query_parameters(params),
+                                                 headers=headers,
+                                                 verify=False,
+                                                 timeout=self.request_timeout(),
+                                                 stream=stream)
+                span['status'] = response.status_code
+                # Time until the cluster sent the response headers, the rest is the download of the body.
+                span['server_secs'] = response.elapsed.total_seconds()
+        except IOError:
+            # A request cut short by the deadline is a timeout of the check.
+            self.request_timeout()
+            raise
+        if response.status_code < 200 or response.status_code > 208:
+            try:
+                message = response.json().get('message')
+            except ValueError:
+                message = response.text
+            response.close()
+            raise APIException('Response status code: {0}, Response message: {1}'.format(
+                response.status_code, message), RestContext(response.request, response))
+        return response
+
+    def records(self, response, path, key):
+        """
+        Method to decode the records of a streamed response, the response is closed at the end
+        :return: generator of the decoded records
+        """
+        stream = JsonStream(response.iter_content(STREAM_CHUNK_SIZE))
+        records = stream.records(key)
+        secs = 0.0
+        count = 0
+        try:
+            while True:
+                start = clock()
+                try:
+                    record = next(records)
+                except StopIteration:
+                    return
+                except IOError:
+                    self.request_timeout()
+                    raise
+                finally:
+                    secs = secs + clock() - start
+                count = count + 1
+                yield record
+        finally:
+            response.close()
+            self.login.timer.add('download', stream.read_secs, path=path)
+            self.login.timer.add('decode', secs - stream.read_secs, path=path, records=count)
+
+    def get_alerts(self, **params):
+        """
+        Method to get the alerts, same parameters as AlertsController.get_alerts
+        :return: list(lst): of Alert
+        """
+        from cohesity_management_sdk.models.alert import Alert
+
+        alerts = self.get_json('/public/alerts', **params) or []
+        with self.login.timer.span('models'):
+            return [Alert.from_dictionary(alert) for alert in alerts]
+
+    def iter_alerts(self, **params):
+        """
+        Method to get the alerts one at a time while the response is received, same parameters as get_alerts
+        :return: generator of Alert
+        """
+        from cohesity_management_sdk.models.alert import Alert
+
+        return self.models(self.iter_json('/public/alerts', **params), Alert)
+
+    def get_active_alerts_stats(self, **params):
+        """
+        Method to get the number of active alerts, same parameters as StatsController.get_active_alerts_stats
+        :return: stats(ActiveAlertsStats)
+        """
+        from cohesity_management_sdk.models.active_alerts_stats import ActiveAlertsStats
+
+        stats = self.get_json('/public/stats/alerts', **params)
+        with self.login.timer.span('models'):
+            return ActiveAlertsStats.from_dictionary(stats)
+
+    def get_protection_jobs(self, **params):
+        """
+        Method to get the protection jobs, same parameters as ProtectionJobsController.get_protection_jobs
+        :return: list(lst): of ProtectionJob
+        """
+        from cohesity_management_sdk.models.protection_job import ProtectionJob
+
+        jobs = self.get_json('/public/protectionJobs', **params) or []
+        with self.login.timer.span('models'):
+            return [ProtectionJob.from_dictionary(job) for job in jobs]
+
+    def get_protection_runs(self, **params):
+        """
+        Method to get the protection runs, same parameters as ProtectionRunsController.get_protection_runs
+        :return: list(lst): of ProtectionRunInstance
+        """
+        from cohesity_management_sdk.models.protection_run_instance import ProtectionRunInstance
+
+        runs = self.get_json('/public/protectionRuns', **params) or []
+        with self.login.timer.span('models'):
+            return [ProtectionRunInstance.from_dictionary(run) for run in runs]
+
+    def iter_protection_runs(self, **params):
+        """
+        Method to get the protection runs one at a time while the response is received, same parameters as
+        get_protection_runs
+        :return: generator of ProtectionRunInstance
+        """
+        from cohesity_management_sdk.models.protection_run_instance import ProtectionRunInstance
+
+        return self.models(self.iter_json('/public/protectionRuns', **params), ProtectionRunInstance)
+
+    def get_cluster(self, **params):
+        """
+        Method to get the cluster information, same parameters as ClusterController.get_cluster
+        :return: cluster_info(Cluster)
+        """
+        from cohesity_management_sdk.models.cluster import Cluster
+
+        cluster = self.get_json('/public/cluster', **params)
+        with self.login.timer.span('models'):
+            return Cluster.from_dictionary(cluster)
+
+    def list_protection_sources_registration_info(self, **params):
+        """
+        Method to get the registered protection sources, same parameters as
+        ProtectionSourcesController.list_protection_sources_registration_info
+        :return: registration_info(GetRegistrationInfoResponse)
+        """
+        from cohesity_management_sdk.models.get_registration_info_response import GetRegistrationInfoResponse
+
+        registration_info = self.get_json('/public/protectionSources/registrationInfo', **params)
+        with self.login.timer.span('models'):
+            return GetRegistrationInfoResponse.from_dictionary(registration_info)
+
+    def models(self, records, model):
+        """
+        Method to build the sdk model of each record of a streamed response
+        :param records: generator of the decoded records
+        :param model: sdk model class
+        :return: generator of the models
+        """
+        secs = 0.0
+        try:
+            for record in records:
+                start = clock()
+                instance = model.from_dictionary(record)
+                secs = secs + clock() - start
+                yield instance
+        finally:
+            self.login.timer.add('models', secs)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# Copyright 2019 Cohesity Inc.
+# Author : Cohesity Developer <cohesity-api-sdks@cohesity.com>
+# This module keeps the last good result of each check, so a check answers at once even when the cluster
+# is slow, instead of holding a nagios poller slot until its timeout and returning UNKNOWN.
+# With --result_cache a check returns its cached result with its age in the performance data
+# (result_age=seconds) and refreshes the result in a background process, which keeps running after the
+# check returned and stores the new result unless it is UNKNOWN. One refresh of a check runs at a time.
+# A cached result older than --result_max_age is returned as UNKNOWN, stale. A check without a cached
+# result runs at once, like without the cache.
+# The results are kept in a locked state file, keyed by check name and commandline arguments.
+#
+
+import fcntl
+import hashlib
+import json
+import os
+import time
+
+from cohesity_defaults import STATE_DIR, UNKNOWN
+
+DEFAULT_RESULT_CACHE = os.path.join(STATE_DIR, 'results.json')
+DEFAULT_MAX_AGE = 900
+# Label of the age of the result in the performance data, the adaptive polling ignores it.
+RESULT_AGE_LABEL = 'result_age'
+
+
+def with_result_age(output, age):
+    """
+    Method to add the age of a result to the performance data of its nagios output
+    :param output(str): nagios output of the check
+    :param age(float): seconds since the result was stored
+    :return: output(str)
+    """
+    lines = output.splitlines() or ['']
+    perfdata = '{0}={1}s;;;0'.format(RESULT_AGE_LABEL, int(age))
+    lines[0] = lines[0] + (' ' if '|' in lines[0] else ' | ') + perfdata
+    return '\n'.join(lines) + '\n'
+
+
+class ResultCache(object):
+    def __init__(self, path=DEFAULT_RESULT_CACHE, max_age=DEFAULT_MAX_AGE):
+        """
+        Method to initialize
+        :param path(str): state file with the cached results
+        :param max_age(int): seconds after which a cached result is stale
+        """
+        self.path = path
+        self.max_age = max_age
+
+    @staticmethod
+    def key(check_name, argv):
+        return json.dumps([check_name, list(argv)])
+
+    def get(self, check_name, argv):
+        """
+        Method to get the cached result of a check
+        :return: entry(dict): exitcode, output and stored_at, None if there is no cached result
+        """
+        from cohesity_token_cache import state_file
+
+        with state_file(self.path, commit=False) as cookie:
+            return cookie.get(self.key(check_name, argv))
+
+    def put(self, check_name, argv, exitcode, output, now=None):
+        """
+        Method to store the result of a check
+        """
+        from cohesity_token_cache import state_file
+
+        with state_file(self.path) as cookie:
+            cookie[self.key(check_name, argv)] = {'exitcode': exitcode,
+                                                  'output': output,
+                                                  'stored_at': now or time.time()}
+
+    def run(self, check_name, argv, run_check):
+        """
+        Method to run a check and store its result, unless it is UNKNOWN
+        :param run_check(function): runs the check, called with the check name and arguments
+        :return: list(lst): of exit code and nagios output
+        """
+        exitcode, output = run_check(check_name, argv)
+        if exitcode != UNKNOWN:
+            self.put(check_name, argv, exitcode, output)
+        return [exitcode, output]
+
+    def refresh(self, check_name, argv, run_check):
+        """
+        Method to refresh the result of a check in a background process, nothing is done while another
+        refresh of the check runs
+        :param run_check(function): runs the check, called with the check name and arguments
+        """
+        key = hashlib.sha1(self.key(check_name, argv).encode('utf-8')).hexdigest()
+        lock = os.open(os.path.join(os.path.dirname(self.path), 'refresh_' + key + '.lock'),
+                       os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            os.close(lock)
+            return
+        if os.fork():
+            # The lock is held by the background process until it ends.
+            os.close(lock)
+            return
+        try:
+            # Nagios waits for the output of the check to be closed, the background process must not keep it.
+            os.setsid()
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for fd in (0, 1, 2):
+                os.dup2(devnull, fd)
+            self.run(check_name, argv, run_check)
+        finally:
+            os._exit(0)
+
+    def result(self, check_name, argv, run_check, now=None):
+        """
+        Method to get the result of a check, the cached result if there is one while it is refreshed
+        :param check_name(str): name of the check script
+        :param argv(list): commandline arguments of the check
+        :param run_check(function): runs the check, called with the check name and arguments
+        :return: list(lst): of exit code and nagios output
+        """
+        entry = self.get(check_name, argv)
+        if entry is None:
+            return self.run(check_name, argv, run_check)
+        self.refresh(check_name, argv, run_check)
+        age = max((now or time.time()) - entry['stored_at'], 0)
+        output = with_result_age(entry['output'], age)
+        if age > self.max_age:
+            return [UNKNOWN, 'UNKNOWN: stale result, {0:.0f} seconds old: {1}'.format(age, output)]
+        return [entry['exitcode'], output]
+
+
+def add_result_cache_args(argp):
+    """
+    Method to add the commandline arguments of the result cache
+    :param argp(ArgumentParser): parser of the script
+    """
+    argp.add_argument('--result_cache', action='store_true',
+                      help='return the last good result at once and refresh it in the background')
+    argp.add_argument('--result_max_age', type=int, default=DEFAULT_MAX_AGE,
+                      help='seconds after which the cached result is returned as UNKNOWN, stale')
+    argp.add_argument('--result_cache_file', default=DEFAULT_RESULT_CACHE,
+                      help='state file used to cache the results of the checks')
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# Copyright 2019 Cohesity Inc.
+# Author : Cohesity Developer <cohesity-api-sdks@cohesity.com>
+# This module keeps one HTTP session per process for all the requests to the Cohesity clusters.
+# The session keeps a pool of keep-alive connections per cluster, so the TCP and TLS handshakes are only
+# done for the first request to a cluster. All the REST calls of the scripts use it, which lets the
+# check daemon and cohesity_multi_cluster.py reuse the connections from check to check.
+# requests is only imported with the first session, a check answered by the check daemon never loads it.
+#
+
+import threading
+
+# Number of clusters with a pool of open connections, the least recently used pool is closed first.
+POOL_CLUSTERS = 64
+# Number of open connections kept per cluster.
+POOL_SIZE = 10
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def shared_session():
+    """
+    Method to get the HTTP session of this process
+    :return: session(requests.Session)
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            import urllib3
+            from requests.adapters import HTTPAdapter
+
+            # The clusters use self-signed certificates.
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_CLUSTERS, pool_maxsize=POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.verify = False
+            _session = session
+    return _session
+
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# Copyright 2019 Cohesity Inc.
+# Author : Cohesity Developer <cohesity-api-sdks@cohesity.com>
+# This module keeps a time series of the used storage of a cluster and forecasts when the storage is full.
+# The samples are kept in a ring of fixed size in a binary state file, the newest sample replaces the oldest one.
+# A least squares line is fitted to the samples of the ring. The sums of the fit are kept in the header of the
+# file and updated with the new and the replaced sample, so adding a sample only reads and writes the header
+# and one slot of the ring, whatever the size of the ring.
+# The file is locked while it is read or written and is only readable by its owner.
+#
+# File layout, little endian:
+#  header: magic, number of slots, number of samples, next slot, time origin, time of the newest sample,
+#          sum of t, sum of y, sum of t*t, sum of t*y
+#  slots:  t and y of each sample, t in days since the time origin, y the used fraction of the capacity
+#
+
+import fcntl
+import os
+import struct
+
+from cohesity_defaults import STATE_DIR, make_state_dir
+
+MAGIC = b'CST1'
+HEADER = struct.Struct('<4sIIIdd4d')
+SAMPLE = struct.Struct('<dd')
+# One sample an hour for 30 days.
+DEFAULT_SLOTS = 720
+DEFAULT_SAMPLE_INTERVAL = 3600
+# Samples needed, and days they must span, before the storage growth is forecast.
+MIN_SAMPLES = 3
+MIN_SPAN_DAYS = 1.0
+SECONDS_IN_DAY = 86400.0
+
+
+class StorageTrend(object):
+    def __init__(self, cluster_vip, slots=DEFAULT_SLOTS, sample_interval=DEFAULT_SAMPLE_INTERVAL,
+                 state_dir=STATE_DIR):
+        """
+        Method to initialize
+        :param cluster_vip(str): Cohesity cluster ip or FQDN
+        :param slots(int): number of samples kept, the oldest one is replaced by a new one
+        :param sample_interval(int): seconds between two samples, samples taken sooner are not kept
+        :param state_dir(str): directory of the time series files
+        """
+        self.path = os.path.join(state_dir, 'storage_trend_' + cluster_vip.replace(os.sep, '_') + '.bin')
+        self.slots = int(slots)
+        self.sample_interval = sample_interval
+
+    def open(self):
+        """
+        Method to open and lock the time series file, a new or damaged file, or one with another number of
+        slots, is started over
+        :return: list(lst): of file object and header fields
+        """
+        make_state_dir(os.path.dirname(self.path))
+        series = os.fdopen(os.open(self.path, os.O_CREAT | os.O_RDWR, 0o600), 'r+b')
+        fcntl.flock(series.fileno(), fcntl.LOCK_EX)
+        header = series.read(HEADER.size)
+        fields = None
+        if len(header) == HEADER.size:
+            fields = list(HEADER.unpack(header))
+        if not fields or fields[0] != MAGIC or fields[1] != self.slots:
+            fields = [MAGIC, self.slots, 0, 0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+            series.seek(0)
+            series.truncate()
+            series.write(HEADER.pack(*fields))
+        return [series, fields]
+
+    def add(self, used_bytes, capacity_bytes, now):
+        """
+        Method to add a sample and get the forecast
+        :param used_bytes(int): used storage
+        :param capacity_bytes(int): storage capacity
+        :param now(float): time of the sample
+        :return: days(float): days until the storage is full, None when it is not growing or there are
+                 not enough samples
+        """
+        series, fields = self.open()
+        try:
+            magic, slots, count, head, origin, newest, sum_t, sum_y, sum_tt, sum_ty = fields
+            if count == 0:
+                origin = now
+            if count == 0 or now - newest >= self.sample_interval:
+                t = (now - origin) / SECONDS_IN_DAY
+                y = float(used_bytes) / float(capacity_bytes)
+                slot = HEADER.size + head * SAMPLE.size
+                if count == slots:
+                    series.seek(slot)
+                    old_t, old_y = SAMPLE.unpack(series.read(SAMPLE.size))
+                    sum_t, sum_y = sum_t - old_t, sum_y - old_y
+                    sum_tt, sum_ty = sum_tt - old_t * old_t, sum_ty - old_t * old_y
+                else:
+                    count = count + 1
+                sum_t, sum_y = sum_t + t, sum_y + y
+                sum_tt, sum_ty = sum_tt + t * t, sum_ty + t * y
+                series.seek(slot)
+                series.write(SAMPLE.pack(t, y))
+                head = (head + 1) % slots
+                newest = now
+                series.seek(0)
+                series.write(HEADER.pack(magic, slots, count, head, origin, newest, sum_t, sum_y, sum_tt, sum_ty))
+        finally:
+            series.close()
+        return days_until_full(count, sum_t, sum_y, sum_tt, sum_ty, (now - origin) / SECONDS_IN_DAY)
+
+
+def days_until_full(count, sum_t, sum_y, sum_tt, sum_ty, t_now):
+    """
+    Method to get the days until the least squares line of the samples reaches the capacity
+    :param count(int): number of samples
+    :param t_now(float): current time in days since the time origin
+    :return: days(float): None when the storage is not growing or there are not enough samples
+    """
+    if count < MIN_SAMPLES:
+        return None
+    # count * count * variance of t, at least the one of samples spread evenly over MIN_SPAN_DAYS
+    variance = count * sum_tt - sum_t * sum_t
+    if variance <= 0 or variance < count * count * MIN_SPAN_DAYS ** 2 / 12:
+        return None
+    slope = (count * sum_ty - sum_t * sum_y) / variance
+    if slope <= 0:
+        return None
+    intercept = (sum_y - slope * sum_t) / count
+    return max((1.0 - intercept) / slope - t_now, 0.0)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# Copyright 2019 Cohesity Inc.
+# Author : Cohesity Developer <cohesity-api-sdks@cohesity.com>
+# This module measures where the time of a check goes: the client set up, the login, every REST call
+# and the processing loops of the checks. Each check has its own Timer, the measured blocks are spans
+# that may be nested, the time of a span does not include the time of the spans inside it.
+# With --timings the total time of each kind of span is added to the performance data of the check,
+# as time_<span>=milliseconds, so it can be graphed like the other metrics.
+# With --timing_trace every span of the run is appended to a JSON lines file, with the path and the
+# status of each REST call and the time the cluster took to answer.
+# A Timer may be shared by threads, the spans are nested per thread and the totals add up the time of
+# every thread, so they may be more than time_total when the calls of a check run in parallel.
+#
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+# Span labels in the performance data start with this prefix, the adaptive polling ignores them.
+TIMING_PREFIX = 'time_'
+TIMING_CONTEXT = 'timing'
+
+# perf_counter is not available on python 2.
+clock = getattr(time, 'perf_counter', time.time)
+
+
+class Timer(object):
+    def __init__(self):
+        """
+        Method to initialize, the run of the check starts now
+        """
+        self.started_at = time.time()
+        self.start = clock()
+        self.spans = []
+        self.totals = {}
+        self.order = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    @property
+    def stack(self):
+        """
+        Time spent in the spans inside each open span of the thread, innermost last
+        """
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    @contextlib.contextmanager
+    def span(self, name, **detail):
+        """
+        Method to measure a block of the check
+        :param name(str): kind of the span, the spans of a kind are added up in the performance data
+        :param detail: extra fields of the span in the trace file
+        :return: detail(dict): fields the block may add to the trace of the span
+        """
+        start = clock()
+        self.stack.append(0.0)
+        try:
+            yield detail
+        finally:
+            duration = clock() - start
+            stack = self.stack
+            children = stack.pop()
+            if stack:
+                stack[-1] = stack[-1] + duration
+            self.record(name, start, duration - children, detail)
+
+    def add(self, name, secs, **detail):
+        """
+        Method to add time measured by the caller, like the decoding of a response spread over a loop,
+        it is taken out of the time of the open span
+        :param name(str): kind of the span
+        :param secs(float): measured seconds
+        :param detail: extra fields of the span in the trace file
+        """
+        stack = self.stack
+        if stack:
+            stack[-1] = stack[-1] + secs
+        self.record(name, clock() - secs, secs, detail)
+
+    def record(self, name, start, secs, detail):
+        detail.update(name=name, offset=round(start - self.start, 6), secs=round(secs, 6))
+        with self.lock:
+            if name not in self.totals:
+                self.totals[name] = 0.0
+                self.order.append(name)
+            self.totals[name] = self.totals[name] + secs
+            self.spans.append(detail)
+
+    def metrics(self):
+        """
+        Method to get the time of each kind of span and the time of the whole run
+        :return: list(lst): of nagiosplugin.Metric in milliseconds
+        """
+        import nagiosplugin
+
+        totals = [[name, self.totals[name]] for name in self.order] + [['total', clock() - self.start]]
+        return [nagiosplugin.Metric(TIMING_PREFIX + name, round(secs * 1000, 3), 'ms', min=0, context=TIMING_CONTEXT)
+                for name, secs in totals]
+
+    def write_trace(self, path, check_name, cluster_vip):
+        """
+        Method to append the spans of the run to a JSON lines trace file
+        :param path(str): trace file
+        :param check_name(str): name of the check
+        :param cluster_vip(str): Cohesity cluster ip or FQDN
+        """
+        line = json.dumps({'check': check_name,
+                           'cluster_vip': cluster_vip,
+                           'started_at': self.started_at,
+                           'total_secs': round(clock() - self.start, 6),
+                           'spans': sorted(self.spans, key=lambda span: span['offset'])}) + '\n'
+        # One write of a file opened for appending, the lines of checks run at the same time are not mixed.
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, line.encode('utf-8'))
+        finally:
+            os.close(fd)
+
+
+def timing_metrics(timer, args, check_name):
+    """
+    Method to report the timings of a check run, called at the end of its probe
+    :param timer(Timer): timer of the check
+    :param args: commandline arguments of the check
+    :param check_name(str): name of the check
+    :return: list(lst): of timing metrics, empty without --timings
+    """
+    if args.timing_trace:
+        timer.write_trace(args.timing_trace, check_name, args.cluster_vip)
+    if args.timings:
+        return timer.metrics()
+    return []
+
+
+def add_timing_args(argp):
+    """
+    Method to add the commandline arguments of the timing instrumentation
+    :param argp(ArgumentParser): parser of the script
+    """
+    argp.add_argument('--timings', action='store_true',
+                      help='add the time of the login, the REST calls and the processing to the performance data')
+    argp.add_argument('--timing_trace', metavar='FILE',
+                      help='append the timed spans of every run to this JSON lines file')
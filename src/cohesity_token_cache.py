@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# Copyright 2019 Cohesity Inc.
+# Author : Cohesity Developer <cohesity-api-sdks@cohesity.com>
+# This module keeps the access tokens of the Cohesity clusters in a local state file so that
+# the cohesity nagios scripts do not log in to the cluster on every run.
+# Tokens are keyed by (cluster_vip, host_name, domain), kept until they expire and refreshed
+# once when the cluster rejects them with a 401. CachedLogin logs in with the REST API and
+# gives the REST client of the cluster.
+# The state file is locked while it is read or written and is only readable by its owner.
+#
+
+import contextlib
+import json
+import logging
+import os
+import time
+
+import nagiosplugin
+
+from cohesity_management_sdk.exceptions.api_exception import APIException
+from cohesity_defaults import STATE_DIR, make_state_dir
+from cohesity_session import shared_session
+from cohesity_timing import Timer
+
+_log = logging.getLogger('nagiosplugin')
+
+DEFAULT_TOKEN_CACHE = os.path.join(STATE_DIR, 'tokens.json')
+# Cohesity access tokens are valid for 24 hours, keep a margin of an hour.
+TOKEN_TTL = 23 * 3600
+
+
+@contextlib.contextmanager
+def state_file(path, commit=True):
+    """
+    Method to open a locked state file readable only by its owner
+    :param path(str): path of the state file
+    :param commit(bool): save the changes when the block completes
+    :return: cookie(nagiosplugin.Cookie): opened cookie
+    """
+    make_state_dir(os.path.dirname(path))
+    os.close(os.open(path, os.O_CREAT | os.O_RDWR, 0o600))
+    os.chmod(path, 0o600)
+    cookie = nagiosplugin.Cookie(path)
+    try:
+        cookie.open()
+    except ValueError:
+        # Cookie truncates a damaged state file, start over with an empty one.
+        cookie.close()
+        cookie.open()
+    try:
+        yield cookie
+        if commit:
+            cookie.commit()
+    finally:
+        cookie.close()
+
+
+class TokenCache(object):
+    def __init__(self, path=DEFAULT_TOKEN_CACHE, ttl=TOKEN_TTL):
+        """
+        Method to initialize
+        :param path(str): state file with the cached tokens
+        :param ttl(int): seconds a token is kept in the cache
+        """
+        self.path = path
+        self.ttl = ttl
+
+    @staticmethod
+    def key(cluster_vip, host_name, domain):
+        return '{0}|{1}|{2}'.format(cluster_vip, host_name, domain)
+
+    def get(self, cluster_vip, host_name, domain):
+        """
+        Method to get a cached token
+        :return: token(dict): token_type and access_token, None if there is no valid token
+        """
+        with state_file(self.path, commit=False) as cookie:
+            token = cookie.get(self.key(cluster_vip, host_name, domain))
+        if token and token['expires_at'] > time.time():
+            return token
+        return None
+
+    def put(self, cluster_vip, host_name, domain, token_type, access_token):
+        """
+        Method to save a token in the cache, expired tokens of other clusters are dropped
+        """
+        now = time.time()
+        with state_file(self.path) as cookie:
+            for key in [k for k, v in cookie.items() if v['expires_at'] <= now]:
+                del cookie[key]
+            cookie[self.key(cluster_vip, host_name, domain)] = {
+                'token_type': token_type,
+                'access_token': access_token,
+                'expires_at': now + self.ttl}
+
+    def invalidate(self, cluster_vip, host_name, domain):
+        """
+        Method to drop a token rejected by the cluster
+        """
+        with state_file(self.path) as cookie:
+            cookie.pop(self.key(cluster_vip, host_name, domain), None)
+
+
+class CachedLogin(object):
+    def __init__(self, cache, cluster_vip, host_name, username, password, domain, timer=None):
+        """
+        Method to initialize
+        :param cache(TokenCache): token cache
+        :param cluster_vip(str): Cohesity cluster ip or FQDN
+        :param host_name(str): host name configured in nagios
+        :param timer(Timer): timer of the check, measures the login and the REST calls
+        """
+        self.cache = cache
+        self.cluster_vip = cluster_vip
+        self.host_name = host_name
+        self.username = username
+        self.password = password
+        self.domain = domain
+        self.timer = timer or Timer()
+        self.token = None
+        # True while the token in use was read from the cache and may have been revoked.
+        self.token_cached = False
+
+    def rest_client(self, timeout=60, deadline=None):
+        """
+        Method to get a REST client of the cluster that uses the cached token
+        :param timeout(int): seconds to wait for the cluster
+        :param deadline(float): time after which the client sends no request, None for no limit
+        :return: client(RestClient)
+        """
+        from cohesity_rest import RestClient
+
+        return RestClient(self, timeout, deadline)
+
+    def call(self, func, *args, **kwargs):
+        """
+        Method to run a REST call, the login is retried once if the cached token is rejected
+        :param func: method of the RestClient
+        :return: response of the call
+        """
+        try:
+            return func(*args, **kwargs)
+        except APIException as e:
+            if e.response_code != 401 or not self.token_cached:
+                raise
+            _log.debug("Cluster ip = {}: cached access token rejected, logging in again".format(
+                self.cluster_vip))
+            self.headers(refresh=True)
+            return func(*args, **kwargs)
+
+    def login(self, timeout=None):
+        """
+        Method to log in to the cluster with the REST API
+        :param timeout(int): seconds to wait for the cluster
+        :return: token(dict): token_type and access_token
+        """
+        creds = json.dumps({
+            "domain": self.domain,
+            "password": self.password,
+            "username": self.username
+        })
+        header = {
+            'accept': 'application/json',
+            'content-type': 'application/json'}
+        with self.timer.span('login') as span:
+            response = shared_session().post('https://' + self.cluster_vip + '/irisservices/api/v1/public/accessTokens',
+                                             data=creds, headers=header, verify=False, timeout=timeout)
+            span['status'] = response.status_code
+        if response.status_code != 201:
+            raise nagiosplugin.CheckError(
+                "Login to cluster {0} failed with status {1}".format(self.cluster_vip, response.status_code))
+        token = response.json()
+        self.cache.put(self.cluster_vip, self.host_name, self.domain,
+                       token['tokenType'], token['accessToken'])
+        return {'token_type': token['tokenType'], 'access_token': token['accessToken']}
+
+    def headers(self, refresh=False, timeout=None):
+        """
+        Method to get the REST API headers with the authorization token
+        :param refresh(bool): drop the cached token and log in again
+        :param timeout(int): seconds to wait for the cluster
+        :return: header(dict)
+        """
+        if refresh:
+            self.cache.invalidate(self.cluster_vip, self.host_name, self.domain)
+            self.token = None
+        elif self.token is None:
+            with self.timer.span('token_cache'):
+                self.token = self.cache.get(self.cluster_vip, self.host_name, self.domain)
+            self.token_cached = self.token is not None
+        if self.token is None:
+            self.token = self.login(timeout)
+            self.token_cached = False
+        return {'accept': 'application/json',
+                'content-type': 'application/json',
+                'authorization': self.token['token_type'] + ' ' + self.token['access_token']}
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# Copyright 2019 Cohesity Inc.
+# Author : Cohesity Developer <cohesity-api-sdks@cohesity.com>
+# This module gets the storage usage history of a cluster from its statistics API
+# (GET /public/statistics/timeSeriesStats) instead of sampling the cluster information on every run.
+# The cluster keeps the usage as a time series, one request gets the hourly rollup of several days.
+# The series is kept per cluster and metric in a locked state file and only fetched again after its ttl,
+# then only the points newer than the cached ones are requested. check_cohesity_storage.py and
+# check_cohesity_metastorage.py compute the current usage, the growth rate and the peak from the series.
+#
+
+import logging
+import os
+import time
+
+from cohesity_token_cache import STATE_DIR, state_file
+
+_log = logging.getLogger('nagiosplugin')
+
+# Schema and metric of the used physical storage and of the used metadata storage of a cluster.
+STORAGE_METRIC = 'kBridgeClusterStats:kMorphedUsageBytes'
+METADATA_METRIC = 'kBridgeClusterStats:kUsedMetadataSpacePct'
+DEFAULT_HISTORY_DAYS = 7
+DEFAULT_HISTORY_TTL = 3600
+DEFAULT_ROLLUP_INTERVAL = 3600
+MILLISECONDS_IN_DAY = 86400 * 1000
+
+
+class UsageHistory(object):
+    def __init__(self, days=DEFAULT_HISTORY_DAYS, ttl=DEFAULT_HISTORY_TTL, rollup_interval=DEFAULT_ROLLUP_INTERVAL,
+                 state_dir=STATE_DIR):
+        """
+        Method to initialize
+        :param days(int): days of history kept
+        :param ttl(int): seconds the cached series is used before the new points are fetched
+        :param rollup_interval(int): seconds of usage the cluster rolls up in one point, with their maximum
+        :param state_dir(str): directory of the series files
+        """
+        self.days = int(days)
+        self.ttl = int(ttl)
+        self.rollup_interval = int(rollup_interval)
+        self.state_dir = state_dir
+
+    def path(self, cluster_vip, metric):
+        return os.path.join(self.state_dir, 'history_{0}_{1}.json'.format(
+            cluster_vip.replace(os.sep, '_'), metric.replace(':', '_')))
+
+    def get_series(self, login, client, cluster_cache, metric):
+        """
+        Method to get the usage history of the cluster
+        :param login(CachedLogin): login of the cluster
+        :param client(RestClient): REST client of the cluster
+        :param cluster_cache(ClusterSnapshotCache): cluster information, read for the cluster id and capacity
+        :param metric(str): SCHEMA:METRIC of the series
+        :return: list(lst): of the points, timestamp in milliseconds and value, oldest first, and the
+                 physical capacity of the cluster in bytes
+        """
+        schema_name, metric_name = metric.split(':', 1)
+        now_msecs = int(time.time() * 1000)
+        start_msecs = now_msecs - self.days * MILLISECONDS_IN_DAY
+        with login.timer.span('usage_history'):
+            # The history file is only written when the series is fetched.
+            with state_file(self.path(login.cluster_vip, metric), commit=False) as cookie:
+                if cookie.get('fetched_at', 0) + self.ttl > time.time() and cookie.get('days') == self.days:
+                    _log.debug("Cluster ip = {}: using {} history from {:.0f} seconds ago".format(
+                        login.cluster_vip, metric_name, time.time() - cookie['fetched_at']))
+                    return [cookie['points'], cookie['capacity_bytes']]
+                if cookie.get('days') != self.days:
+                    cookie.clear()
+                # The cluster id and capacity are read with the series, once per ttl.
+                cluster_info = cluster_cache.get_cluster(login, client)
+                points = [point for point in cookie.get('points', []) if point[0] >= start_msecs]
+                response = login.call(client.get_json, '/public/statistics/timeSeriesStats',
+                                      schema_name=schema_name,
+                                      metric_name=metric_name,
+                                      entity_id=cluster_info.id,
+                                      start_time_msecs=points[-1][0] + 1 if points else start_msecs,
+                                      end_time_msecs=now_msecs,
+                                      rollup_function='max',
+                                      rollup_interval_secs=self.rollup_interval)
+                for point in response.get('dataPointVec') or []:
+                    data = point.get('data') or {}
+                    value = data.get('int64Value', data.get('doubleValue'))
+                    if value is not None:
+                        points.append([point['timestampMsecs'], value])
+                _log.debug("Cluster ip = {}: {} history has {} points".format(
+                    login.cluster_vip, metric_name, len(points)))
+                cookie['points'] = points
+                cookie['capacity_bytes'] = cluster_info.stats.usage_perf_stats.physical_capacity_bytes
+                cookie['days'] = self.days
+                cookie['fetched_at'] = time.time()
+                cookie.commit()
+                return [points, cookie['capacity_bytes']]
+
+
+def growth_per_day(points):
+    """
+    Method to get the growth of a series, the slope of the least squares line of its points
+    :param points(list): of timestamp in milliseconds and value
+    :return: growth(float): change of the value per day, None with fewer than two points
+    """
+    if len(points) < 2:
+        return None
+    count = float(len(points))
+    origin = points[0][0]
+    days = [float(timestamp - origin) / MILLISECONDS_IN_DAY for timestamp, value in points]
+    mean_t = sum(days) / count
+    mean_y = sum(value for timestamp, value in points) / count
+    variance = sum((t - mean_t) ** 2 for t in days)
+    if variance == 0:
+        return None
+    return sum((t - mean_t) * (point[1] - mean_y) for t, point in zip(days, points)) / variance
+
+
+def history_metrics(label, percents):
+    """
+    Method to get the growth and peak metrics of a usage history
+    :param label(str): name of the used storage in the metric names
+    :param percents(list): of timestamp in milliseconds and used percent, oldest first
+    :return: list(lst): of nagiosplugin.Metric
+    """
+    import nagiosplugin
+
+    metrics = [nagiosplugin.Metric(
+        'Peak used ' + label,
+        round(max(percent for timestamp, percent in percents), 1),
+        '%',
+        min=0,
+        max=100,
+        context='peak')]
+    growth = growth_per_day(percents)
+    if growth is not None:
+        metrics.append(nagiosplugin.Metric(
+            label[0].upper() + label[1:] + ' growth per day',
+            round(growth, 3),
+            '%',
+            context='growth'))
+    return metrics
+
+
+def add_history_contexts(check, args):
+    """
+    Method to add the nagios contexts of the growth and peak metrics
+    :param check(nagiosplugin.Check): check of the script
+    :param args: commandline arguments
+    """
+    import nagiosplugin
+
+    check.add(nagiosplugin.ScalarContext('growth', args.growth_warning, args.growth_critical))
+    check.add(nagiosplugin.ScalarContext('peak'))
+
+
+def add_history_args(argp, metric):
+    """
+    Method to add the commandline arguments of the usage history
+    :param argp(ArgumentParser): parser of the script
+    :param metric(str): default SCHEMA:METRIC of the series
+    """
+    argp.add_argument('--history', action='store_true',
+                      help='get the usage, its growth and its peak from the usage history of the cluster')
+    argp.add_argument('--history_days', type=int, default=DEFAULT_HISTORY_DAYS,
+                      help='days of usage history the growth and the peak are computed from')
+    argp.add_argument('--history_ttl', type=int, default=DEFAULT_HISTORY_TTL,
+                      help='seconds the usage history is cached before its new points are fetched')
+    argp.add_argument('--history_metric', default=metric, metavar='SCHEMA:METRIC',
+                      help='statistics schema and metric of the usage history')
+    argp.add_argument('--growth_warning', metavar='RANGE',
+                      help='return warning if the growth in percent per day is outside RANGE')
+    argp.add_argument('--growth_critical', metavar='RANGE',
+                      help='return critical if the growth in percent per day is outside RANGE')